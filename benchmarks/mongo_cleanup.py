@@ -0,0 +1,112 @@
+""" Compare per-test mongo cleanup strategies on a schema of many indexed collections.
+
+Usage:
+    python benchmarks/mongo_cleanup.py [--uri mongodb://localhost:27017/?replicaSet=rs0] [--collections 50] [--tests 200]
+
+Every simulated test writes to a couple of collections and then the database is
+cleaned, either by dropping it (and rebuilding indexes, as mongoengine has to do on
+next write), by emptying only collections written during the test or, if the
+server is a replica set, by aborting the transaction the test wrote in.
+"""
+# inbuild python imports
+import argparse
+import os
+import sys
+import timeit
+
+# third party imports
+import pymongo
+from django.conf import settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not settings.configured:
+    settings.configure()
+
+# local imports
+from test_addons.cleanup import MongoDirtyCleanup
+from test_addons.monitoring import command_listener
+from test_addons.utils import supports_transactions
+
+
+DB_NAME = 'test_addons_benchmark'
+
+
+def create_schema(db, num_of_collections):
+    for index in range(num_of_collections):
+        collection = db['collection_{0}'.format(index)]
+        collection.create_index('name')
+        collection.create_index([('created', pymongo.DESCENDING), ('owner', pymongo.ASCENDING)])
+
+
+def write(db, test_number, num_of_collections, session = None):
+    for index in (test_number % num_of_collections, (test_number * 7) % num_of_collections):
+        db['collection_{0}'.format(index)].insert_many([{'name': str(i), 'created': i, 'owner': test_number} for i in range(10)], session = session)
+
+
+def run_drop(client, num_of_tests, num_of_collections, read_only):
+    db = client[DB_NAME]
+    create_schema(db, num_of_collections)
+
+    for test_number in range(num_of_tests):
+        if not read_only:
+            write(db, test_number, num_of_collections)
+
+        client.drop_database(DB_NAME)
+        create_schema(db, num_of_collections)
+
+
+def run_dirty(client, num_of_tests, num_of_collections, read_only):
+    db = client[DB_NAME]
+    cleanup = MongoDirtyCleanup.for_database(DB_NAME)
+    create_schema(db, num_of_collections)
+    cleanup.clear()
+
+    for test_number in range(num_of_tests):
+        if not read_only:
+            write(db, test_number, num_of_collections)
+
+        cleanup.clean(db)
+
+
+def run_transaction(client, num_of_tests, num_of_collections, read_only):
+    db = client[DB_NAME]
+    create_schema(db, num_of_collections)
+
+    for test_number in range(num_of_tests):
+        with client.start_session() as session:
+            session.start_transaction()
+
+            if not read_only:
+                write(db, test_number, num_of_collections, session)
+
+            session.abort_transaction()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default = 'mongodb://localhost:27017')
+    parser.add_argument('--collections', type = int, default = 50)
+    parser.add_argument('--tests', type = int, default = 200)
+    options = parser.parse_args()
+
+    client = pymongo.MongoClient(options.uri, event_listeners = [command_listener.pymongo_listener()])
+    strategies = [('drop_database', run_drop), ('dirty', run_dirty)]
+
+    if supports_transactions(client):
+        strategies.append(('transaction', run_transaction))
+    else:
+        print('server is not a replica set, skipping transaction strategy')
+
+    for read_only in (False, True):
+        for name, strategy in strategies:
+            client.drop_database(DB_NAME)
+            elapsed = timeit.timeit(lambda: strategy(client, options.tests, options.collections, read_only), number = 1)
+            print('{0:<14} {1:<10} {2:8.3f} ms/test'.format(name, 'read-only' if read_only else 'writing', elapsed * 1000.0 / options.tests))
+
+    client.drop_database(DB_NAME)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+""" Measure per-test overhead of every TestCase class shipped in test_addons.test_cases.
+
+Usage:
+    python benchmarks/test_cases.py [--tests 100] [--backend memory|server] [--spawn]
+                                    [--output results.json] [--compare baseline.json]
+
+For every class, N empty tests and N tests writing to each backend the class uses
+are run. Reported per test: backend setup, teardown, test body and total time (ms),
+and commands sent per backend. Reported per run: time spent in class level setup
+and teardown, and growth of memory allocated by python (tracemalloc).
+
+With '--backend memory' (default) mongo and redis are in-memory stand-ins, with
+'--backend server' they are servers from --mongo-uri and --redis-url, or local
+mongod and redis-server started in temporary directories with --spawn. Neo4j
+classes need py2neo and --neo4j-link, otherwise they are reported as skipped.
+
+Results are written as JSON, so runs can be compared across commits with --compare.
+"""
+# inbuild python imports
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+# third party imports
+from django.conf import settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_timer = time.perf_counter
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout = 30):
+    deadline = time.time() + timeout
+
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout = 1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+    raise RuntimeError('server did not start listening on port {0}'.format(port))
+
+
+class LocalServers(object):
+
+    """ mongod and redis-server started in temporary directories, stopped on exit """
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix = 'test_addons_benchmark_')
+        self.processes = []
+        self.mongo_port = free_port()
+        self.redis_port = free_port()
+
+    def __enter__(self):
+        for binary in ('mongod', 'redis-server'):
+            if not shutil.which(binary):
+                raise RuntimeError('{0} not found on PATH, needed by --spawn'.format(binary))
+
+        dbpath = os.path.join(self.directory, 'mongo')
+        os.mkdir(dbpath)
+        self._start(['mongod', '--dbpath', dbpath, '--port', str(self.mongo_port), '--bind_ip', '127.0.0.1'], self.mongo_port)
+        self._start(['redis-server', '--port', str(self.redis_port), '--dir', self.directory, '--save', '', '--appendonly', 'no'], self.redis_port)
+
+        return self
+
+    def _start(self, command, port):
+        self.processes.append(subprocess.Popen(command, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL))
+        wait_for_port(port)
+
+    def __exit__(self, *exc_info):
+        for process in self.processes:
+            process.terminate()
+            process.wait()
+
+        shutil.rmtree(self.directory, ignore_errors = True)
+
+
+def configure(options, servers = None):
+    mongo_uri = 'mongodb://127.0.0.1:{0}'.format(servers.mongo_port) if servers else options.mongo_uri
+    redis_url = 'redis://127.0.0.1:{0}/15'.format(servers.redis_port) if servers else options.redis_url
+
+    settings.configure(
+        SECRET_KEY = 'benchmark',
+        INSTALLED_APPS = ['django.contrib.contenttypes', 'django.contrib.auth'],
+        DATABASES = {},
+        ALLOWED_HOSTS = ['*'],
+        TEST_ADDONS_BACKEND = options.backend,
+        TEST_MONGO_DATABASE = {'db': 'test_addons_benchmark', 'host': mongo_uri, 'port': None},
+        CACHES = {'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': redis_url}},
+        NEO4J_TEST_LINK = options.neo4j_link,
+    )
+
+    import django
+    django.setup()
+
+
+def writing_test(index):
+    """ (int) -> (function)
+    return test method writing to every backend of its test case.
+    """
+    from test_addons import mixins
+
+    def test(self):
+        if isinstance(self, mixins.MongoTestMixin):
+            BenchmarkDocument(title = str(index)).save()
+
+        if isinstance(self, mixins.RedisTestMixin):
+            from django.core.cache import cache
+            cache.set('benchmark:{0}'.format(index), index)
+
+        if isinstance(self, mixins.Neo4jTestMixin):
+            from py2neo import Node
+            self.graph_db.create(Node(self.NEO4J_NAMESPACE or 'Benchmark', index = index))
+
+    return test
+
+
+def empty_test(self):
+    pass
+
+
+def build_case(base, num_of_tests, writing):
+    attributes = {'__module__': 'benchmark', 'databases': set()}
+
+    for index in range(num_of_tests):
+        attributes['test_{0:05d}'.format(index)] = writing_test(index) if writing else empty_test
+
+    return type('{0}_{1}'.format(base.__name__, 'writing' if writing else 'empty'), (base, ), attributes)
+
+
+def mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def run_case(case):
+    """ (type) -> (dict)
+    run every test of 'case' and return its timings.
+    """
+    from test_addons.runner import TimingResultMixin
+    from test_addons.timing import timing_report
+
+    result = type('BenchmarkResult', (TimingResultMixin, unittest.TestResult), {})()
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(case)
+
+    timing_report.clear()
+    timing_report.enable()
+    gc.collect()
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    start = _timer()
+
+    try:
+        suite.run(result)
+    finally:
+        elapsed = _timer() - start
+        gc.collect()
+        memory_after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        timing_report.disable()
+
+    problems = result.errors + result.failures
+
+    if problems:
+        return {'error': problems[0][1].strip().splitlines()[-1]}
+
+    timings = list(timing_report.tests.values())
+    backends = sorted(set(backend for timing in timings for backend in timing.commands))
+
+    return {
+        'setup_ms': mean([sum(duration for phase, duration in timing.phases.items() if phase.endswith('.setup')) for timing in timings]) * 1000,
+        'teardown_ms': mean([timing.phases.get('teardown', 0.0) for timing in timings]) * 1000,
+        'body_ms': mean([timing.body or 0.0 for timing in timings]) * 1000,
+        'total_ms': mean([timing.total for timing in timings]) * 1000,
+        'class_ms': max(elapsed - sum(timing.total for timing in timings), 0.0) * 1000,
+        'memory_kb': (memory_after - memory_before) / 1024.0,
+        'commands': dict((backend, mean([timing.commands.get(backend, 0) for timing in timings])) for backend in backends),
+    }
+
+
+def test_case_classes():
+    import test_addons.test_cases
+    from django.test import SimpleTestCase as DjangoSimpleTestCase
+
+    return [(name, value) for name, value in sorted(vars(test_addons.test_cases).items())
+        if isinstance(value, type) and issubclass(value, DjangoSimpleTestCase) and value.__module__ == 'test_addons.test_cases']
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)['results']
+
+    print('\nChange of total_ms per test against {0}:'.format(baseline_path))
+
+    for name, kinds in sorted(results.items()):
+        for kind, current in sorted(kinds.items()):
+            previous = baseline.get(name, {}).get(kind, {})
+
+            if 'total_ms' in current and previous.get('total_ms'):
+                change = (current['total_ms'] - previous['total_ms']) / previous['total_ms'] * 100
+                print('  {0:<32} {1:<8} {2:8.3f} -> {3:8.3f} ms ({4:+.1f}%)'.format(name, kind, previous['total_ms'], current['total_ms'], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tests', type = int, default = 100)
+    parser.add_argument('--backend', choices = ('memory', 'server'), default = 'memory')
+    parser.add_argument('--spawn', action = 'store_true', help = 'start local mongod and redis-server in temporary directories')
+    parser.add_argument('--mongo-uri', default = 'mongodb://127.0.0.1:27017')
+    parser.add_argument('--redis-url', default = 'redis://127.0.0.1:6379/15')
+    parser.add_argument('--neo4j-link', default = None)
+    parser.add_argument('--only', nargs = '*', help = 'names of test case classes to run')
+    parser.add_argument('--output', default = 'benchmark_results.json')
+    parser.add_argument('--compare', help = 'earlier results file to compare with')
+    options = parser.parse_args()
+
+    if options.spawn:
+        options.backend = 'server'
+
+        with LocalServers() as servers:
+            results = run(options, servers)
+    else:
+        results = run(options)
+
+    with open(options.output, 'w') as output_file:
+        json.dump({
+            'commit': commit(),
+            'python': platform.python_version(),
+            'backend': options.backend,
+            'tests': options.tests,
+            'results': results,
+        }, output_file, indent = 2, sort_keys = True)
+
+    print('\nresults written to {0}'.format(options.output))
+
+    if options.compare:
+        compare(results, options.compare)
+
+
+def run(options, servers = None):
+    configure(options, servers)
+
+    global BenchmarkDocument
+    import mongoengine
+
+    class BenchmarkDocument(mongoengine.Document):
+        title = mongoengine.StringField()
+
+    results = {}
+    print('{0:<32} {1:<8} {2:>9} {3:>9} {4:>9} {5:>9} {6:>9} {7:>10}  commands'.format('class', 'tests', 'setup', 'teardown', 'body', 'total', 'class', 'memory'))
+
+    for name, base in test_case_classes():
+        if options.only and name not in options.only:
+            continue
+
+        if issubclass(base, _neo4j_mixin()) and not options.neo4j_link:
+            results[name] = {'skipped': 'needs --neo4j-link'}
+            print('{0:<32} skipped, needs --neo4j-link'.format(name))
+            continue
+
+        for writing in (False, True):
+            kind = 'writing' if writing else 'empty'
+            result = results.setdefault(name, {})[kind] = run_case(build_case(base, options.tests, writing))
+
+            if 'error' in result:
+                print('{0:<32} {1:<8} error: {2}'.format(name, kind, result['error']))
+                continue
+
+            print('{0:<32} {1:<8} {2:8.3f}ms {3:8.3f}ms {4:8.3f}ms {5:8.3f}ms {6:7.1f}ms {7:8.1f}kB  {8}'.format(
+                name, kind, result['setup_ms'], result['teardown_ms'], result['body_ms'], result['total_ms'], result['class_ms'], result['memory_kb'],
+                ' '.join('{0}={1:g}'.format(backend, count) for backend, count in sorted(result['commands'].items()))))
+
+    return results
+
+
+def _neo4j_mixin():
+    from test_addons.mixins import Neo4jTestMixin
+    return Neo4jTestMixin
+
+
+if __name__ == '__main__':
+    main()
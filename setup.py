@@ -19,6 +19,7 @@ setup(
         'redis_testing': ['django-redis>=3.8.2'],
         'neo4j_testing': ['py2neo>=2.0.6'],
         'rest_framework_testing': ['djangorestframework>=3.0.5'],
+        'memory_testing': ['mongomock>=3.19.0', 'fakeredis>=1.0'],
     },
 	classifiers=[
         'Development Status :: 5 - Production/Stable',
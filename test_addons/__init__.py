@@ -1,2 +1,50 @@
-from .test_cases import (MongoTestCase, MongoLiveServerTestCase, SimpleTestCase, RedisTestCase, Neo4jTestCase, RedisMongoNeo4jTestCase, MongoRedisTestCase, APIRedisTestCase, APIMongoTestCase, APINeo4jTestCase, APIMongoRedisTestCase, APIRedisMongoNeo4jTestCase)
-from .utils import EnhancedHttpRequest, TestViewMixin, ClearFileStorageMixin, ModifySessionMixin
+import importlib
+import sys
+
+# public name -> module defining it, imported on first access, so 'import test_addons'
+# does not import django's test framework or any database driver
+_exports = {
+    'SimpleTestCase': 'test_cases',
+    'MongoTestCase': 'test_cases',
+    'MongoLiveServerTestCase': 'test_cases',
+    'RedisTestCase': 'test_cases',
+    'Neo4jTestCase': 'test_cases',
+    'MongoNeo4jTestCase': 'test_cases',
+    'MongoRedisTestCase': 'test_cases',
+    'RedisMongoNeo4jTestCase': 'test_cases',
+    'APIRedisTestCase': 'test_cases',
+    'APIMongoTestCase': 'test_cases',
+    'APINeo4jTestCase': 'test_cases',
+    'APIMongoRedisTestCase': 'test_cases',
+    'APIRedisMongoNeo4jTestCase': 'test_cases',
+    'EnhancedHttpRequest': 'utils',
+    'TestViewMixin': 'utils',
+    'ClearFileStorageMixin': 'utils',
+    'CopyLargeFileMixin': 'utils',
+    'ModifySessionMixin': 'utils',
+    'DocumentFactory': 'factories',
+    'Sequence': 'factories',
+    'Reference': 'factories',
+}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+    value = getattr(importlib.import_module('.' + _exports[name], __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
+
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ is not supported, import everything up front
+    for _name in _exports:
+        globals()[_name] = __getattr__(_name)
@@ -0,0 +1,124 @@
+# inbuild python imports
+import importlib
+import threading
+from collections import OrderedDict
+
+# inbuilt django imports
+from django.conf import settings
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+
+
+MEMORY_BACKEND = 'memory'
+SERVER_BACKEND = 'server'
+
+
+# backend name -> (modules it needs, test case using it, for error message)
+_registry = OrderedDict()
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register_backend(name, modules, test_case_name):
+    """ (str, tuple, str) -> (NoneType)
+    register driver 'modules' a backend needs, imported by load_backend on first use of its test case.
+    """
+    _registry[name] = (tuple(modules), test_case_name)
+    _loaded.pop(name, None)
+
+
+register_backend('mongo', ('mongoengine', 'pymongo'), 'MongoTestCase')
+register_backend('redis', ('django_redis', ), 'RedisTestCase')
+register_backend('neo4j', ('py2neo', ), 'Neo4j test cases')
+register_backend('api', ('rest_framework.test', ), 'API test cases')
+register_backend('memory', ('mongomock', 'fakeredis'), "TEST_ADDONS_BACKEND = 'memory'")
+
+
+def load_backend(name):
+    """ (str) -> (list)
+    import driver modules of backend 'name' (once per process), return them.
+
+    Raises ImportError naming the missing module if any of them cannot be imported.
+    """
+    with _lock:
+        if name not in _loaded:
+            modules, test_case_name = _registry[name]
+
+            try:
+                _loaded[name] = [importlib.import_module(module) for module in modules]
+            except ImportError as exc:
+                raise ImportError("{0} must be installed to use {1}. Exception details:- {2}".format(
+                    ' and '.join(modules), test_case_name, repr(exc)))
+
+        return _loaded[name]
+
+
+def get_backend():
+    """ (NoneType) -> (str)
+    return backend configured by TEST_ADDONS_BACKEND setting, 'server' (default) or 'memory'.
+    """
+    backend = getattr(settings, 'TEST_ADDONS_BACKEND', SERVER_BACKEND)
+
+    if backend not in (SERVER_BACKEND, MEMORY_BACKEND):
+        raise ValueError("TEST_ADDONS_BACKEND must be either 'server' or 'memory', not {0!r}.".format(backend))
+
+    return backend
+
+
+def is_memory_backend():
+    return get_backend() == MEMORY_BACKEND
+
+
+class LazyImport(object):
+
+    """ Proxy to module (or attribute of module) imported on first use.
+
+    Evaluates to False if it cannot be imported, like the optional imports
+    set to None it replaces.
+    """
+
+    def __init__(self, module_name, attribute = None):
+        self.__dict__['_module_name'] = module_name
+        self.__dict__['_attribute'] = attribute
+
+    def _resolve(self):
+        if '_target' not in self.__dict__:
+            module = importlib.import_module(self._module_name)
+
+            if self._attribute is None:
+                target = module
+            elif hasattr(module, self._attribute):
+                target = getattr(module, self._attribute)
+            else:
+                # attribute is a submodule, not imported by its package
+                target = importlib.import_module('{0}.{1}'.format(self._module_name, self._attribute))
+
+            self.__dict__['_target'] = target
+
+        return self.__dict__['_target']
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __bool__(self):
+        try:
+            self._resolve()
+        except ImportError:
+            return False
+
+        return True
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<LazyImport {0}{1}>'.format(self._module_name, '.' + self._attribute if self._attribute else '')
@@ -0,0 +1,494 @@
+# inbuild python imports
+import threading
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .monitoring import (CommandSubscriber, GraphSubscriber, RedisSubscriber, command_listener, is_cypher_write,
+    redis_command_name, redis_key, redis_listener)
+
+
+WRITE_COMMANDS = frozenset(['insert', 'update', 'delete', 'findAndModify', 'findandmodify', 'create'])
+# collections these are run on are dropped on cleanup, so snapshot restores their indexes too
+DDL_COMMANDS = frozenset(['drop', 'createIndexes', 'dropIndexes', 'deleteIndexes', 'collMod'])
+AGGREGATE_OUTPUT_STAGES = ('$out', '$merge')
+
+
+class MongoDirtyCleanup(CommandSubscriber):
+
+    """ Track collections written during a test and empty only those on cleanup.
+
+    Collections are emptied with delete_many, so their indexes are kept,
+    and cleanup is skipped entirely if nothing was written. Collections
+    dropped, renamed or having indexes changed are dropped instead, and
+    whole database if it was dropped.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.dirty_collections = set()
+        self.ddl_collections = set()
+        self.database_dropped = False
+        self.database_reset = False
+        self.ignored_session = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_database(cls, db_name):
+        """ (type, str) -> (MongoDirtyCleanup)
+        return process wide cleanup instance for 'db_name', subscribing it to command listener.
+        """
+        with cls._instances_lock:
+            if db_name not in cls._instances:
+                cls._instances[db_name] = cls(db_name)
+                command_listener.subscribe(cls._instances[db_name])
+
+            return cls._instances[db_name]
+
+    def started(self, event):
+        if event.command_name == 'renameCollection':
+            # run on admin database, with namespaces of both collections
+            return self._renamed(event.command)
+
+        if event.database_name != self.db_name or self._in_ignored_transaction(event.command):
+            return
+
+        if event.command_name == 'dropDatabase':
+            with self._lock:
+                self.database_dropped = True
+            return
+
+        if event.command_name in DDL_COMMANDS:
+            with self._lock:
+                self.ddl_collections.add(event.command.get(event.command_name))
+            return
+
+        collection = self._written_collection(event.command_name, event.command)
+
+        if collection:
+            with self._lock:
+                self.dirty_collections.add(collection)
+
+    def _renamed(self, command):
+        prefix = '{0}.'.format(self.db_name)
+        namespaces = [command.get('renameCollection'), command.get('to')]
+        collections = [namespace[len(prefix):] for namespace in namespaces if namespace and namespace.startswith(prefix)]
+
+        with self._lock:
+            self.ddl_collections.update(collections)
+
+    def ignore_transaction(self, session):
+        """ (MongoDirtyCleanup, ClientSession) -> (NoneType)
+        stop tracking writes made inside transaction of 'session', which are rolled back by aborting it.
+        Pass None to track every write again.
+        """
+        self.ignored_session = session.session_id if session else None
+
+    def _in_ignored_transaction(self, command):
+        return self.ignored_session is not None and 'txnNumber' in command and command.get('lsid') == self.ignored_session
+
+    def _written_collection(self, command_name, command):
+        if command_name in WRITE_COMMANDS:
+            return command.get(command_name)
+
+        if command_name == 'aggregate':
+            for stage in command.get('pipeline', []):
+                for output_stage in AGGREGATE_OUTPUT_STAGES:
+                    if output_stage in stage:
+                        return _target_collection(stage[output_stage])
+
+    def reset_database(self, db):
+        """ (MongoDirtyCleanup, Database) -> (NoneType)
+        drop the database once per process, so leftovers of earlier runs cannot leak into tests.
+        """
+        if self.database_reset:
+            return
+
+        db.client.drop_database(self.db_name)
+        self.database_reset = True
+        self.clear()
+
+    def clean(self, db):
+        """ (MongoDirtyCleanup, Database) -> (tuple)
+        empty every collection written since last cleanup, dropping ones DDL was run on.
+
+        return (names of cleaned collections, names of dropped ones), or (None, None)
+        if database was dropped during the test, and is dropped again.
+        """
+        with self._lock:
+            database_dropped = self.database_dropped
+            dropped = sorted(self.ddl_collections)
+            collections = sorted(self.dirty_collections | self.ddl_collections)
+
+        if database_dropped:
+            db.client.drop_database(self.db_name)
+            collections = dropped = None
+        else:
+            for collection in collections:
+                if collection in dropped:
+                    db.drop_collection(collection)
+                else:
+                    db[collection].delete_many({})
+
+        # commands issued above are writes too
+        self.clear()
+        return collections, dropped
+
+    def clear(self):
+        with self._lock:
+            self.dirty_collections.clear()
+            self.ddl_collections.clear()
+            self.database_dropped = False
+
+    @property
+    def dirty(self):
+        return bool(self.dirty_collections or self.ddl_collections or self.database_dropped)
+
+
+def _target_collection(target):
+    """ (str or dict) -> (str)
+    return collection name from $out or $merge stage target.
+    """
+    while isinstance(target, dict):
+        target = target.get('into', target.get('coll'))
+
+    return target
+
+
+REDIS_NON_CREATING_COMMANDS = frozenset([
+    'GET', 'MGET', 'GETRANGE', 'STRLEN', 'EXISTS', 'TTL', 'PTTL', 'TYPE', 'KEYS', 'SCAN', 'DBSIZE', 'INFO',
+    'TIME', 'OBJECT', 'DUMP', 'TOUCH', 'RANDOMKEY', 'MEMORY', 'CONFIG', 'SCRIPT', 'LASTSAVE',
+    'HGET', 'HGETALL', 'HMGET', 'HKEYS', 'HVALS', 'HLEN', 'HEXISTS', 'HSTRLEN', 'HSCAN', 'HRANDFIELD',
+    'LRANGE', 'LLEN', 'LINDEX', 'LPOS', 'SMEMBERS', 'SISMEMBER', 'SMISMEMBER', 'SCARD', 'SRANDMEMBER', 'SSCAN',
+    'SUNION', 'SINTER', 'SDIFF', 'SINTERCARD', 'ZRANGE', 'ZRANGEBYSCORE', 'ZREVRANGE', 'ZREVRANGEBYSCORE',
+    'ZRANGEBYLEX', 'ZREVRANGEBYLEX', 'ZSCORE', 'ZMSCORE', 'ZCARD', 'ZCOUNT', 'ZLEXCOUNT', 'ZRANK',
+    'ZREVRANK', 'ZSCAN', 'ZRANDMEMBER', 'PFCOUNT', 'GETBIT', 'BITCOUNT', 'BITPOS', 'GEOPOS', 'GEODIST',
+    'GEOHASH', 'GEOSEARCH', 'GEORADIUS_RO', 'GEORADIUSBYMEMBER_RO', 'XRANGE', 'XREVRANGE', 'XLEN', 'XREAD',
+    'XINFO', 'XPENDING', 'MULTI', 'EXEC', 'DISCARD', 'WATCH', 'UNWATCH',
+])
+# keys deleted, or expiring, are recorded too, so snapshot restores them
+REDIS_DELETE_COMMANDS = frozenset(['DEL', 'UNLINK'])
+REDIS_DESTINATION_COMMANDS = frozenset([
+    'RENAME', 'RENAMENX', 'COPY', 'RPOPLPUSH', 'BRPOPLPUSH', 'LMOVE', 'BLMOVE', 'SMOVE',
+])
+REDIS_SCRIPT_COMMANDS = frozenset(['EVAL', 'EVALSHA', 'EVAL_RO', 'EVALSHA_RO', 'FCALL', 'FCALL_RO'])
+
+
+def redis_written_keys(args):
+    """ (tuple) -> (list or NoneType)
+    return keys possibly created, changed, deleted or expired by redis command, or None if they cannot be determined.
+    """
+    name = redis_command_name(args)
+
+    if name in REDIS_NON_CREATING_COMMANDS:
+        return []
+
+    if name in REDIS_DELETE_COMMANDS:
+        return list(args[1:])
+
+    if name in ('MSET', 'MSETNX'):
+        return list(args[1::2])
+
+    if name in REDIS_DESTINATION_COMMANDS:
+        # source is renamed, popped from or moved from too
+        return list(args[1:3])
+
+    if name in ('FLUSHDB', 'FLUSHALL'):
+        return None
+
+    if name == 'BITOP':
+        return list(args[2:3])
+
+    if name in REDIS_SCRIPT_COMMANDS:
+        num_of_keys = int(args[2])
+        return list(args[3:3 + num_of_keys])
+
+    if len(args) > 1 and not name.startswith(('FUNCTION', 'CLUSTER', 'ACL', 'SLOWLOG', 'LATENCY', 'MODULE')):
+        return [args[1]]
+
+
+def redis_server_key(client):
+    """ (Redis) -> (tuple)
+    return (host, port, db), or (unix socket path, db), identifying database redis client talks to.
+    """
+    connection_kwargs = client.connection_pool.connection_kwargs
+
+    if connection_kwargs.get('path'):
+        return (connection_kwargs['path'], connection_kwargs.get('db', 0))
+
+    return (connection_kwargs.get('host', 'localhost'), connection_kwargs.get('port', 6379), connection_kwargs.get('db', 0))
+
+
+class _RedisTarget(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.key_prefixes = set()
+        self.written_keys = set()
+        self.untracked_write = False
+
+
+class RedisCleanup(RedisSubscriber):
+
+    """ Delete keys written through redis connections since last cleanup.
+
+    Connections talking to same (host, port, db) are cleaned once. Written keys
+    are deleted with a single pipelined UNLINK, and nothing is sent to redis if
+    nothing was written. If keys written by a command cannot be determined, the
+    database (or only keys with configured key prefix) is cleared instead.
+    """
+
+    DELETE_BATCH_SIZE = 1000
+    _cleared_servers = set()
+
+    def __init__(self, clients, key_prefixes = None):
+        self.targets = {}
+        self._pool_targets = {}
+        self._lock = threading.Lock()
+
+        for client, key_prefix in zip(clients, key_prefixes or [None] * len(clients)):
+            server_key = redis_server_key(client)
+            target = self.targets.setdefault(server_key, _RedisTarget(client))
+
+            if key_prefix:
+                target.key_prefixes.add(key_prefix)
+
+            self._pool_targets[id(client.connection_pool)] = target
+            redis_listener.instrument(client)
+
+    def start(self):
+        redis_listener.subscribe(self)
+
+    def stop(self):
+        redis_listener.unsubscribe(self)
+
+    def redis_round_trip(self, round_trip):
+        target = self._pool_targets.get(id(round_trip.pool))
+
+        if target is None:
+            return
+
+        with self._lock:
+            for args in round_trip.commands:
+                keys = redis_written_keys(args)
+
+                if keys is None:
+                    target.untracked_write = True
+                else:
+                    target.written_keys.update(redis_key(key) for key in keys)
+
+    def reset(self):
+        """ (RedisCleanup) -> (NoneType)
+        clear every database not cleared yet in this process, to get rid of leftovers of earlier runs.
+        """
+        with redis_listener.suspended():
+            for server_key, target in sorted(self.targets.items(), key = lambda item: repr(item[0])):
+                if server_key not in self._cleared_servers:
+                    self._clear(target)
+                    self._cleared_servers.add(server_key)
+
+        self.forget()
+
+    def flush(self):
+        """ (RedisCleanup) -> (dict)
+        clear every database (or every key with configured prefix), return dict like clean.
+        """
+        with redis_listener.suspended():
+            for server_key, target in sorted(self.targets.items(), key = lambda item: repr(item[0])):
+                self._clear(target)
+
+        self.forget()
+        return dict((server_key, None) for server_key in self.targets)
+
+    def forget(self):
+        """ (RedisCleanup) -> (NoneType)
+        forget keys written so far, without deleting them.
+        """
+        with self._lock:
+            for target in self.targets.values():
+                target.written_keys, target.untracked_write = set(), False
+
+    def clean(self):
+        """ (RedisCleanup) -> (dict)
+        delete keys written since last cleanup.
+
+        return dict mapping server key of every cleaned database to set of deleted
+        keys, or None if whole database (or every key with configured prefix) was cleared.
+        """
+        cleaned = {}
+
+        with redis_listener.suspended():
+            for server_key, target in sorted(self.targets.items(), key = lambda item: repr(item[0])):
+                with self._lock:
+                    written_keys, target.written_keys = target.written_keys, set()
+                    clear_all, target.untracked_write = target.untracked_write, False
+
+                if clear_all:
+                    self._clear(target)
+                    cleaned[server_key] = None
+                elif written_keys:
+                    self._unlink(target.client, list(written_keys))
+                    cleaned[server_key] = written_keys
+
+        return cleaned
+
+    def _clear(self, target):
+        if not target.key_prefixes:
+            return target.client.flushdb()
+
+        for key_prefix in target.key_prefixes:
+            self._unlink(target.client, list(target.client.scan_iter(match = '{0}:*'.format(key_prefix), count = self.DELETE_BATCH_SIZE)))
+
+    def _unlink(self, client, keys):
+        if not keys:
+            return
+
+        pipeline = client.pipeline(transaction = False)
+
+        for start in range(0, len(keys), self.DELETE_BATCH_SIZE):
+            pipeline.unlink(*keys[start:start + self.DELETE_BATCH_SIZE])
+
+        pipeline.execute()
+
+
+def _entity_nodes(entity):
+    """ (object) -> (list)
+    return nodes of py2neo Node, Relationship or Path 'entity'.
+    """
+    if hasattr(entity, 'start_node'):
+        return [entity.start_node, entity.end_node]
+
+    if hasattr(entity, 'labels'):
+        return [entity]
+
+    return list(getattr(entity, 'nodes', None) or ())
+
+
+class Neo4jNamespaceLabel(GraphSubscriber):
+
+    """ Add 'namespace' label to new nodes passed to Graph.create, so cleanup scoped to namespace covers them.
+
+    Nodes created by cypher statements, or from plain dicts and tuples, must carry the label themselves.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def graph_entities_creating(self, entities):
+        for entity in entities:
+            for node in _entity_nodes(entity):
+                if not getattr(node, 'bound', False):
+                    node.labels.add(self.namespace)
+
+
+class Neo4jCleanup(GraphSubscriber):
+
+    """ Delete nodes and relationships created during a test in fixed size batches.
+
+    Entities created through Graph.create, including end nodes created along with
+    a relationship, are deleted by id. If any other write was issued, every node
+    (only nodes with 'namespace' label, if given) is deleted. Nothing is sent to
+    neo4j if no write was issued. Subscribe it to graph_listener to see writes of
+    every py2neo Graph.
+    """
+
+    BATCH_SIZE = 10000
+
+    def __init__(self, graph, namespace = None, batch_size = None):
+        self.graph = graph
+        self.namespace = namespace
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.node_ids = set()
+        # relationship id -> ids of its start and end node
+        self.relationship_ids = {}
+        self.untracked_write = False
+        # python ids of nodes not yet bound when passed to Graph.create
+        self._creating = set()
+        self._lock = threading.Lock()
+
+    def cypher_statement(self, statement, parameters):
+        if is_cypher_write(statement):
+            self.untracked_write = True
+
+    def graph_entities_creating(self, entities):
+        with self._lock:
+            self._creating.update(id(node) for entity in entities for node in _entity_nodes(entity) if not getattr(node, 'bound', False))
+
+    def graph_entities_created(self, entities):
+        with self._lock:
+            for entity in entities:
+                entity_id = getattr(entity, '_id', None)
+
+                if entity_id is None:
+                    self.untracked_write = True
+                elif hasattr(entity, 'start_node'):
+                    self.relationship_ids[entity_id] = (getattr(entity.start_node, '_id', None), getattr(entity.end_node, '_id', None))
+
+                    # only end nodes created along with relationship, not ones existing before
+                    for node in _entity_nodes(entity):
+                        if id(node) in self._creating:
+                            self._creating.discard(id(node))
+                            self.node_ids.add(node._id)
+                else:
+                    self._creating.discard(id(entity))
+                    self.node_ids.add(entity_id)
+
+    def graph_write(self, method_name):
+        self.untracked_write = True
+
+    @property
+    def dirty(self):
+        return bool(self.untracked_write or self.node_ids or self.relationship_ids)
+
+    def clean(self):
+        """ (Neo4jCleanup) -> (bool)
+        delete entities written since last cleanup, in batches of 'batch_size'.
+
+        return True if every node (in namespace) was deleted, False if only tracked entities were.
+        """
+        deleted_all = self.untracked_write
+
+        if not (self.untracked_write and not self.namespace):
+            # relationships of tracked nodes go away with them, by DETACH DELETE
+            relationship_ids = [relationship_id for relationship_id, node_ids in self.relationship_ids.items()
+                if not self.node_ids.intersection(node_ids)]
+
+            # directed pattern lets neo4j look relationships up by id, instead of scanning them
+            self._delete_ids('MATCH ()-[r]->() WHERE id(r) IN {ids} DELETE r', relationship_ids)
+            self._delete_ids('MATCH (n) WHERE id(n) IN {ids} DETACH DELETE n', self.node_ids)
+
+        if self.untracked_write:
+            label = ':{0}'.format(self.namespace) if self.namespace else ''
+            self._delete_in_batches('MATCH (n{0}) WITH n LIMIT {1} DETACH DELETE n RETURN count(*)'.format(label, self.batch_size))
+
+        self.forget()
+        return deleted_all
+
+    def delete_all(self):
+        """ (Neo4jCleanup) -> (NoneType)
+        delete every node (in namespace) in batches of 'batch_size'.
+        """
+        self.untracked_write = True
+        self.clean()
+
+    def forget(self):
+        with self._lock:
+            self.node_ids, self.relationship_ids, self.untracked_write = set(), {}, False
+            self._creating.clear()
+
+    def _delete_in_batches(self, query):
+        while self.graph.cypher.execute_one(query):
+            pass
+
+    def _delete_ids(self, query, ids):
+        ids = sorted(ids)
+
+        for start in range(0, len(ids), self.batch_size):
+            self.graph.cypher.execute(query, {'ids': ids[start:start + self.batch_size]})
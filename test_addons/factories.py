@@ -0,0 +1,206 @@
+# inbuild python imports
+import itertools
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .backends import load_backend
+from .monitoring import query_recorder
+
+
+class Sequence(object):
+
+    """ Field value made from index of document in its factory, e.g. Sequence('user{0}@example.com')
+    or Sequence(lambda index: index * 10).
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __call__(self, index):
+        if callable(self.template):
+            return self.template(index)
+
+        return self.template.format(index)
+
+
+class Reference(object):
+
+    """ Field value referencing documents of another DocumentFactory.
+
+    By default documents already created by 'factory' are referenced in turn.
+    With create = True a new document is built by 'factory' for every referencing
+    document, and inserted (in batches too) before the documents referencing it.
+    """
+
+    def __init__(self, factory, create = False, **overrides):
+        self.factory = factory
+        self.create = create
+        self.overrides = overrides
+
+    def __call__(self, index):
+        if self.create:
+            document = self.factory.build(**self.overrides)
+            self.factory._pending.append(document)
+
+            return document
+
+        if not self.factory.references:
+            raise ValueError("{0} has not created any documents to reference yet, documents inserted by stream are not referenced.".format(self.factory))
+
+        return self.factory.references[index % len(self.factory.references)]
+
+
+class DocumentFactory(object):
+
+    """ Build mongoengine documents in memory and insert them with unordered, batched insert_many.
+
+    'defaults' are field values of every document, Sequence and Reference values are
+    computed per document, other callables are called without arguments. Documents
+    get their ObjectId primary key when built, so they can be referenced before insert.
+
+    Inserts skip mongoengine's save signals, and are not counted by query assertions
+    of MongoTestMixin unless count_queries is True. Database cleanup still sees them.
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, document, batch_size = None, validate = True, count_queries = False, **defaults):
+        load_backend('mongo')
+
+        self.document = document
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.validate = validate
+        self.count_queries = count_queries
+        self.defaults = defaults
+        # DBRef of every document inserted by factory, except by stream, referenced by Reference values
+        self.references = []
+        self._pending = []
+        # factories building documents referenced by this one's, see Reference(create = True)
+        self._dependencies = set()
+        self._counter = itertools.count()
+
+    def __repr__(self):
+        return '<DocumentFactory {0}>'.format(self.document.__name__)
+
+    def build(self, **overrides):
+        """ (DocumentFactory, **object) -> (Document)
+        return new, not inserted, document with factory defaults updated by 'overrides'.
+        """
+        from bson import ObjectId
+        from mongoengine.fields import ObjectIdField
+
+        index = next(self._counter)
+        values = dict(self.defaults, **overrides)
+
+        for name, value in values.items():
+            if isinstance(value, Reference) and value.create:
+                self._dependencies.add(value.factory)
+
+            if isinstance(value, (Sequence, Reference)):
+                values[name] = value(index)
+            elif callable(value) and not isinstance(value, type):
+                values[name] = value()
+
+        document = self.document(**values)
+        id_field = self.document._meta.get('id_field')
+
+        if document.pk is None and isinstance(self.document._fields.get(id_field), ObjectIdField):
+            document.pk = ObjectId()
+
+        return document
+
+    def build_batch(self, num, **overrides):
+        """ (DocumentFactory, int, **object) -> (generator)
+        generate 'num' new, not inserted, documents.
+        """
+        for _ in range(num):
+            yield self.build(**overrides)
+
+    def create(self, **overrides):
+        return self.create_batch(1, **overrides)[0]
+
+    def create_batch(self, num, **overrides):
+        """ (DocumentFactory, int, **object) -> (list)
+        build and insert 'num' documents, return them.
+        """
+        documents = list(self.build_batch(num, **overrides))
+        self.insert(documents)
+
+        return documents
+
+    def stream(self, num, **overrides):
+        """ (DocumentFactory, int, **object) -> (int)
+        build and insert 'num' documents, holding only one batch of them in memory at a time,
+        return number of documents inserted.
+
+        Streamed documents, and ones created for their Reference(create = True) values,
+        are not added to 'references', so Reference values of other factories cannot point to them.
+        """
+        return self.insert(self.build_batch(num, **overrides), keep_references = False)
+
+    def insert(self, documents, keep_references = True):
+        """ (DocumentFactory, iterable, bool) -> (int)
+        insert built 'documents' in batches of 'batch_size', return number of documents inserted.
+        """
+        inserted = 0
+        batch = []
+
+        for document in documents:
+            batch.append(document)
+
+            if len(batch) >= self.batch_size:
+                inserted += self._insert_batch(batch, keep_references)
+                batch = []
+
+        if batch:
+            inserted += self._insert_batch(batch, keep_references)
+
+        return inserted
+
+    def flush(self, keep_references = True):
+        """ (DocumentFactory, bool) -> (int)
+        insert documents built for Reference(create = True) values of other factories.
+        """
+        pending, self._pending = self._pending, []
+
+        return self.insert(pending, keep_references)
+
+    def _insert_batch(self, documents, keep_references):
+        # documents referenced with Reference(create = True) must exist first
+        for factory in list(self._dependencies):
+            factory.flush(keep_references)
+
+        from bson import DBRef
+
+        if self.validate:
+            for document in documents:
+                document.validate()
+
+        sons = [document.to_mongo() for document in documents]
+        collection = self.document._get_collection()
+
+        # in transaction of MONGO_ISOLATION = 'transaction' test, see utils.bind_session
+        if self.count_queries:
+            collection.insert_many(sons, ordered = False)
+        else:
+            with query_recorder.suspended():
+                collection.insert_many(sons, ordered = False)
+
+        collection_name = collection.name
+
+        for document, son in zip(documents, sons):
+            if document.pk is None:
+                document.pk = son['_id']
+
+            document._created = False
+            document._clear_changed_fields()
+
+            if keep_references:
+                self.references.append(DBRef(collection_name, document.pk))
+
+        return len(documents)
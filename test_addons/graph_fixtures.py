@@ -0,0 +1,168 @@
+# inbuild python imports
+import gzip
+import io
+import json
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .monitoring import _timer
+
+
+NODE = 'n'
+RELATIONSHIP = 'r'
+
+
+def read_fixture(path):
+    """ (str) -> (generator)
+    generate records of compact graph fixture file at 'path' (gzipped if it ends with '.gz').
+
+    Every line is a JSON array, either a node or a relationship between nodes defined before it:
+        ["n", "alice", "Person:Employee", {"name": "Alice"}]
+        ["r", "alice", "KNOWS", "bob", {"since": 2010}]
+    Properties may be left out, blank lines and lines starting with '#' are skipped.
+    """
+    opener = gzip.open if path.endswith('.gz') else io.open
+
+    with opener(path, 'rt') as fixture_file:
+        for line in fixture_file:
+            line = line.strip()
+
+            if line and not line.startswith('#'):
+                yield json.loads(line)
+
+
+class GraphLoadReport(object):
+
+    """ Number of entities loaded by GraphFixtureLoader, statements it took and throughput achieved """
+
+    def __init__(self):
+        self.nodes = 0
+        self.relationships = 0
+        self.statements = 0
+        self.seconds = 0.0
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    @property
+    def relationships_per_second(self):
+        return self.relationships / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return '{0} nodes, {1} relationships in {2} statements, {3:.2f}s ({4:.0f} nodes/s, {5:.0f} relationships/s)'.format(
+            self.nodes, self.relationships, self.statements, self.seconds, self.nodes_per_second, self.relationships_per_second)
+
+    __repr__ = __str__
+
+
+class GraphFixtureLoader(object):
+
+    """ Load nodes and relationships with parameterized UNWIND ... CREATE statements, BATCH_SIZE rows each.
+
+    Records are consumed as they come, only one pending batch per label set (or
+    relationship type) and ids of created nodes, by fixture key, are kept in memory.
+    Relationships are queued by node keys, which are resolved to ids when their batch
+    is created, so interleaved nodes and relationships still load in full batches.
+    Every statement runs in its own transaction. Nodes get 'namespace' label too,
+    if given.
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, graph, batch_size = None, namespace = None):
+        self.graph = graph
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.namespace = namespace
+        # fixture key -> id of node created for it
+        self.node_ids = {}
+        self._nodes = {}
+        self._relationships = {}
+        self.report = GraphLoadReport()
+
+    def load(self, records):
+        """ (GraphFixtureLoader, iterable) -> (GraphLoadReport)
+        load node and relationship records (see read_fixture), return report of this and earlier loads.
+        """
+        started = _timer()
+
+        try:
+            for record in records:
+                if record[0] == NODE:
+                    self.add_node(*record[1:])
+                elif record[0] == RELATIONSHIP:
+                    self.add_relationship(*record[1:])
+                else:
+                    raise ValueError('graph fixture record must start with {0!r} or {1!r}, not {2!r}'.format(NODE, RELATIONSHIP, record))
+
+            self.flush()
+        finally:
+            self.report.seconds += _timer() - started
+
+        return self.report
+
+    def add_node(self, key, labels, properties = None):
+        if isinstance(labels, (list, tuple)):
+            labels = tuple(labels)
+        else:
+            labels = tuple(label for label in labels.split(':') if label)
+
+        if self.namespace:
+            labels += (self.namespace, )
+
+        rows = self._nodes.setdefault(tuple(sorted(set(labels))), [])
+        rows.append({'key': key, 'properties': properties or {}})
+
+        if len(rows) >= self.batch_size:
+            self._create_nodes(labels, rows)
+
+    def add_relationship(self, start, relationship_type, end, properties = None):
+        rows = self._relationships.setdefault(relationship_type, [])
+        rows.append({'start': start, 'end': end, 'properties': properties or {}})
+
+        if len(rows) >= self.batch_size:
+            self._create_relationships(relationship_type, rows)
+
+    def flush(self):
+        self._flush_nodes()
+
+        for relationship_type, rows in sorted(self._relationships.items()):
+            if rows:
+                self._create_relationships(relationship_type, rows)
+
+    def _node_id(self, key):
+        try:
+            return self.node_ids[key]
+        except KeyError:
+            raise KeyError('graph fixture relationship refers to undefined node {0!r}'.format(key))
+
+    def _flush_nodes(self):
+        for labels, rows in sorted(self._nodes.items()):
+            if rows:
+                self._create_nodes(labels, rows)
+
+    def _create_nodes(self, labels, rows):
+        query = 'UNWIND {{rows}} AS row CREATE (n{0}) SET n = row.properties RETURN row.key, id(n)'.format(''.join(':`{0}`'.format(label) for label in sorted(set(labels))))
+
+        self.node_ids.update((key, node_id) for key, node_id in self.graph.cypher.execute(query, {'rows': rows}))
+        self.report.nodes += len(rows)
+        self.report.statements += 1
+        del rows[:]
+
+    def _create_relationships(self, relationship_type, rows):
+        # nodes still pending are created first, once for the whole batch
+        if any(row['start'] not in self.node_ids or row['end'] not in self.node_ids for row in rows):
+            self._flush_nodes()
+
+        query = 'UNWIND {{rows}} AS row MATCH (a), (b) WHERE id(a) = row.start AND id(b) = row.end CREATE (a)-[r:`{0}`]->(b) SET r = row.properties'.format(relationship_type)
+        resolved_rows = [dict(row, start = self._node_id(row['start']), end = self._node_id(row['end'])) for row in rows]
+
+        self.graph.cypher.execute(query, {'rows': resolved_rows})
+        self.report.relationships += len(rows)
+        self.report.statements += 1
+        del rows[:]
@@ -0,0 +1,340 @@
+# inbuild python imports
+import threading
+from collections import Counter
+
+try:
+    from http.client import HTTPConnection
+    from urllib.parse import urlencode, urlsplit
+except ImportError:
+    from httplib import HTTPConnection
+    from urllib import urlencode
+    from urlparse import urlsplit
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .monitoring import IGNORED_COMMANDS, CommandSubscriber, _timer, command_listener
+from .performance import LatencyStats
+
+
+THREADS = 'threads'
+ASYNCIO = 'asyncio'
+
+
+class LoadReport(object):
+
+    """ Outcome of LoadGenerator run: throughput, latency, errors and mongo commands issued by the server """
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.mongo_commands = Counter()
+        self.seconds = 0.0
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def failed(self):
+        """ number of requests which raised or got server error response """
+        return sum(self.errors.values()) + sum(count for status, count in self.statuses.items() if status >= 500)
+
+    @property
+    def error_rate(self):
+        return float(self.failed) / self.requests if self.requests else 0.0
+
+    @property
+    def throughput(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    @property
+    def latency(self):
+        return LatencyStats(self.latencies)
+
+    @property
+    def mongo_commands_per_request(self):
+        return float(sum(self.mongo_commands.values())) / self.requests if self.requests else 0.0
+
+    def add(self, milliseconds, status = None, error = None):
+        self.latencies.append(milliseconds)
+
+        if error is not None:
+            self.errors[error] += 1
+        else:
+            self.statuses[status] += 1
+
+    def __str__(self):
+        lines = [
+            '{0} requests from {1} clients in {2:.2f}s, {3:.1f} requests/s'.format(self.requests, self.concurrency, self.seconds, self.throughput),
+            'latency: {0}'.format(self.latency),
+            'errors: {0} ({1:.2%}) statuses: {2}'.format(self.failed, self.error_rate, ' '.join('{0}={1}'.format(status, count) for status, count in sorted(self.statuses.items()))),
+            'mongo commands: {0} ({1:.1f} per request) {2}'.format(
+                sum(self.mongo_commands.values()), self.mongo_commands_per_request,
+                ' '.join('{0}={1}'.format(name, count) for name, count in sorted(self.mongo_commands.items()))),
+        ]
+        lines.extend('    {0} x {1}'.format(count, error) for error, count in self.errors.most_common())
+
+        return '\n'.join(lines)
+
+    __repr__ = __str__
+
+
+class _MongoCommandCounter(CommandSubscriber):
+
+    """ Count mongo commands sent to 'database' from any thread, e.g. live server's """
+
+    def __init__(self, database, counter):
+        self.database = database
+        self.counter = counter
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.database_name == self.database and event.command_name not in IGNORED_COMMANDS:
+            with self._lock:
+                self.counter[event.command_name] += 1
+
+
+class LoadGenerator(object):
+
+    """ Send requests to a live server from 'concurrency' concurrent HTTP clients.
+
+    Clients are threads, each keeping its own connection alive, or coroutines of
+    one asyncio event loop (mode 'asyncio'), each opening a connection per request.
+    Load runs until 'requests' are sent in total, or for 'duration' seconds.
+    """
+
+    def __init__(self, base_url, concurrency = 10, mode = THREADS, timeout = 30):
+        if mode not in (THREADS, ASYNCIO):
+            raise ValueError("mode must be either {0!r} or {1!r}, not {2!r}.".format(THREADS, ASYNCIO, mode))
+
+        parsed = urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.concurrency = concurrency
+        self.mode = mode
+        self.timeout = timeout
+
+    def run(self, path, method = 'GET', data = None, headers = None, requests = None, duration = None, mongo_database = None):
+        """ (LoadGenerator, str, str, dict or bytes, dict, int, float, str) -> (LoadReport)
+        send 'method' requests to 'path', with 'data' (form encoded if dict), and report outcome.
+
+        Mongo commands sent to 'mongo_database' during the run are counted.
+        """
+        if requests is None and duration is None:
+            raise ValueError('either requests or duration must be given')
+
+        if isinstance(data, dict):
+            body = urlencode(data, doseq = True).encode('utf-8')
+            headers = dict({'Content-Type': 'application/x-www-form-urlencoded'}, **(headers or {}))
+        else:
+            body = data
+
+        request = (method, path, body, dict(headers or {}, Host = '{0}:{1}'.format(self.host, self.port)))
+        report = LoadReport(self.concurrency)
+        counter = _MongoCommandCounter(mongo_database, report.mongo_commands) if mongo_database else None
+
+        if counter:
+            command_listener.subscribe(counter)
+
+        started = _timer()
+
+        try:
+            budget = _RequestBudget(requests, None if duration is None else started + duration)
+
+            if self.mode == THREADS:
+                self._run_threads(request, budget, report)
+            else:
+                self._run_asyncio(request, budget, report)
+        finally:
+            report.seconds = _timer() - started
+
+            if counter:
+                command_listener.unsubscribe(counter)
+
+        return report
+
+    def _run_threads(self, request, budget, report):
+        lock = threading.Lock()
+
+        def client():
+            connection = HTTPConnection(self.host, self.port, timeout = self.timeout)
+
+            try:
+                while budget.take():
+                    outcome = self._send(connection, request)
+
+                    with lock:
+                        report.add(*outcome)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target = client, name = 'test_addons_load_{0}'.format(number)) for number in range(self.concurrency)]
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def _send(self, connection, request):
+        method, path, body, headers = request
+        started = _timer()
+
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        except Exception as exc:
+            # reconnect on next request
+            connection.close()
+            return ((_timer() - started) * 1000.0, None, '{0}: {1}'.format(type(exc).__name__, exc))
+
+        return ((_timer() - started) * 1000.0, response.status, None)
+
+    def _run_asyncio(self, request, budget, report):
+        import asyncio
+
+        loop = asyncio.new_event_loop()
+        payload = self._raw_request(request)
+        done = loop.create_future()
+        clients = [self.concurrency]
+
+        def send():
+            if not budget.take():
+                clients[0] -= 1
+
+                if not clients[0]:
+                    done.set_result(None)
+
+                return
+
+            _HttpRequestProtocol(loop, self.host, self.port, payload, self.timeout, record).start()
+
+        def record(milliseconds, status, error):
+            report.add(milliseconds, status, error)
+            send()
+
+        for _ in range(self.concurrency):
+            loop.call_soon(send)
+
+        try:
+            loop.run_until_complete(done)
+        finally:
+            loop.close()
+
+    def _raw_request(self, request):
+        method, path, body, headers = request
+        # server closes connection after response, so its end is end of response
+        headers = dict(headers, Connection = 'close')
+
+        if body:
+            headers['Content-Length'] = str(len(body))
+
+        head = '{0} {1} HTTP/1.1\r\n{2}\r\n'.format(method, path, ''.join('{0}: {1}\r\n'.format(name, value) for name, value in headers.items()))
+
+        return head.encode('latin-1') + (body or b'')
+
+
+class _HttpRequestProtocol(object):
+
+    """ asyncio protocol sending one raw HTTP request over its own connection, reads response until server closes it """
+
+    def __init__(self, loop, host, port, payload, timeout, callback):
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.payload = payload
+        self.timeout = timeout
+        # called with (milliseconds, status, error) once request is over
+        self.callback = callback
+        self.response = bytearray()
+        self.transport = None
+        self.connecting = None
+        self.timer = None
+        self.started = None
+
+    def start(self):
+        self.started = _timer()
+        self.connecting = self.loop.create_task(self.loop.create_connection(lambda: self, self.host, self.port))
+        self.connecting.add_done_callback(self._connected)
+        self.timer = self.loop.call_later(self.timeout, self._timed_out)
+
+    def _connected(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            exc = future.exception()
+            self._finish(error = '{0}: {1}'.format(type(exc).__name__, exc))
+
+    def _timed_out(self):
+        self.connecting.cancel()
+
+        if self.transport is not None:
+            self.transport.abort()
+
+        self._finish(error = 'timeout: no response in {0}s'.format(self.timeout))
+
+    def _finish(self, status = None, error = None):
+        if self.callback is None:
+            return
+
+        callback, self.callback = self.callback, None
+        self.timer.cancel()
+        callback((_timer() - self.started) * 1000.0, status, error)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(self.payload)
+
+    def data_received(self, data):
+        self.response.extend(data)
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            return self._finish(error = '{0}: {1}'.format(type(exc).__name__, exc))
+
+        try:
+            status = int(bytes(self.response).split(b' ', 2)[1])
+        except (IndexError, ValueError):
+            return self._finish(error = 'invalid response: {0!r}'.format(bytes(self.response[:80])))
+
+        self._finish(status = status)
+
+    def pause_writing(self):
+        pass
+
+    def resume_writing(self):
+        pass
+
+
+class _RequestBudget(object):
+
+    """ Hands out permission to send next request until 'requests' are sent or 'deadline' passes """
+
+    def __init__(self, requests = None, deadline = None):
+        self.remaining = requests
+        self.deadline = deadline
+        self._lock = threading.Lock()
+
+    def take(self):
+        if self.deadline is not None and _timer() >= self.deadline:
+            return False
+
+        if self.remaining is None:
+            return True
+
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+
+            self.remaining -= 1
+            return True
@@ -0,0 +1,351 @@
+# inbuild python imports
+import itertools
+
+# inbuilt django imports
+
+# third party imports
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# inter-app imports
+
+# local imports
+from .monitoring import _timer, command_listener
+
+
+_request_ids = itertools.count(1)
+
+
+class MemoryCommandEvent(object):
+
+    """ Command event published for operations on in-memory collections, with attributes
+    subscribers of command listener use from pymongo's command events.
+    """
+
+    def __init__(self, database_name, command_name, command, request_id):
+        self.database_name = database_name
+        self.command_name = command_name
+        self.command = command
+        self.request_id = request_id
+        self.operation_id = request_id
+        self.connection_id = ('memory', 0)
+        self.duration_micros = None
+        self.reply = None
+        self.failure = None
+
+
+def _run_published(database_name, commands, func, args, kwargs, reply = None):
+    """ (str, list, callable, tuple, dict, callable) -> (object)
+    call 'func', publishing started and succeeded (or failed) events of 'commands', (command_name, command)
+    tuples, around it.
+
+    'reply' builds reply document from return value of func.
+    """
+    events = [MemoryCommandEvent(database_name, command_name, command, next(_request_ids)) for command_name, command in commands]
+
+    for event in events:
+        command_listener.started(event)
+
+    start = _timer()
+
+    try:
+        result = func(*args, **kwargs)
+    except Exception as exc:
+        for event in events:
+            event.duration_micros = int((_timer() - start) * 1000000)
+            event.failure = {'errmsg': str(exc), 'ok': 0}
+            command_listener.failed(event)
+        raise
+
+    for event in events:
+        event.duration_micros = int((_timer() - start) * 1000000)
+        event.reply = dict(reply(result) if reply else {}, ok = 1)
+        command_listener.succeeded(event)
+
+    return result
+
+
+def _bulk_write_commands(collection_name, requests, ordered):
+    """ (str, list, bool) -> (list)
+    return (command_name, command) of insert, update and delete commands pymongo would send for bulk write 'requests'.
+    """
+    commands = []
+
+    for request in requests:
+        command_name, field, statement = _bulk_write_statement(request)
+
+        # ordered bulk sends consecutive requests of same kind together, unordered groups them by kind
+        if ordered:
+            same_kind = commands[-1] if commands and commands[-1][0] == command_name else None
+        else:
+            same_kind = next((command for command in commands if command[0] == command_name), None)
+
+        if same_kind:
+            same_kind[1][field].append(statement)
+        else:
+            commands.append((command_name, {command_name: collection_name, field: [statement]}))
+
+    return commands
+
+
+def _bulk_write_statement(request):
+    kind = type(request).__name__
+
+    if kind == 'InsertOne':
+        return 'insert', 'documents', request._doc
+
+    if kind in ('DeleteOne', 'DeleteMany'):
+        return 'delete', 'deletes', {'q': request._filter, 'limit': 1 if kind == 'DeleteOne' else 0}
+
+    return 'update', 'updates', {'q': request._filter, 'u': request._doc, 'multi': kind == 'UpdateMany', 'upsert': bool(request._upsert)}
+
+
+class MemoryCollection(object):
+
+    """ Proxy to mongomock collection, publishing a command event to command listener for each operation.
+
+    Only mongomock knows the documents returned by a cursor, so 'find' and 'aggregate'
+    events do not report them. Operations not wrapped below (reads mongomock has beyond
+    these) are passed through unrecorded.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def __eq__(self, other):
+        return self._collection == getattr(other, '_collection', other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._collection.full_name)
+
+    def with_options(self, *args, **kwargs):
+        return MemoryCollection(self._collection.with_options(*args, **kwargs))
+
+    def _execute(self, command_name, fields, method_name, args, kwargs, reply = None):
+        """ (MemoryCollection, str, dict, str, tuple, dict, callable) -> (object)
+        call mongomock collection method, publishing started and succeeded (or failed) events around it.
+
+        'reply' builds reply document from return value of method.
+        """
+        command = dict([(command_name, self._collection.name)], **fields)
+
+        return _run_published(self._collection.database.name, [(command_name, command)],
+            getattr(self._collection, method_name), args, kwargs, reply)
+
+    def insert_one(self, document, *args, **kwargs):
+        return self._execute('insert', {'documents': [document]}, 'insert_one', (document, ) + args, kwargs,
+            lambda result: {'n': 1})
+
+    def insert_many(self, documents, *args, **kwargs):
+        documents = list(documents)
+        return self._execute('insert', {'documents': documents}, 'insert_many', (documents, ) + args, kwargs,
+            lambda result: {'n': len(result.inserted_ids)})
+
+    def find(self, filter = None, *args, **kwargs):
+        return self._execute('find', {'filter': filter or {}}, 'find', (filter, ) + args, kwargs)
+
+    def find_one(self, filter = None, *args, **kwargs):
+        return self._execute('find', {'filter': filter or {}, 'limit': 1}, 'find_one', (filter, ) + args, kwargs,
+            lambda result: {'cursor': {'firstBatch': [result] if result else []}})
+
+    def _update(self, method_name, filter, update, args, kwargs, multi):
+        statement = {'q': filter, 'u': update, 'multi': multi, 'upsert': kwargs.get('upsert', False)}
+        return self._execute('update', {'updates': [statement]}, method_name, (filter, update) + args, kwargs,
+            lambda result: {'n': result.matched_count + (1 if result.upserted_id is not None else 0), 'nModified': result.modified_count})
+
+    def update_one(self, filter, update, *args, **kwargs):
+        return self._update('update_one', filter, update, args, kwargs, False)
+
+    def update_many(self, filter, update, *args, **kwargs):
+        return self._update('update_many', filter, update, args, kwargs, True)
+
+    def replace_one(self, filter, replacement, *args, **kwargs):
+        return self._update('replace_one', filter, replacement, args, kwargs, False)
+
+    def _delete(self, method_name, filter, args, kwargs, limit):
+        return self._execute('delete', {'deletes': [{'q': filter, 'limit': limit}]}, method_name, (filter, ) + args, kwargs,
+            lambda result: {'n': result.deleted_count})
+
+    def delete_one(self, filter, *args, **kwargs):
+        return self._delete('delete_one', filter, args, kwargs, 1)
+
+    def delete_many(self, filter, *args, **kwargs):
+        return self._delete('delete_many', filter, args, kwargs, 0)
+
+    def _find_and_modify(self, method_name, filter, args, kwargs):
+        return self._execute('findAndModify', {'query': filter}, method_name, (filter, ) + args, kwargs,
+            lambda result: {'value': result})
+
+    def find_one_and_delete(self, filter, *args, **kwargs):
+        return self._find_and_modify('find_one_and_delete', filter, args, kwargs)
+
+    def find_one_and_replace(self, filter, *args, **kwargs):
+        return self._find_and_modify('find_one_and_replace', filter, args, kwargs)
+
+    def find_one_and_update(self, filter, *args, **kwargs):
+        return self._find_and_modify('find_one_and_update', filter, args, kwargs)
+
+    def count_documents(self, filter, *args, **kwargs):
+        return self._execute('count', {'query': filter}, 'count_documents', (filter, ) + args, kwargs,
+            lambda result: {'n': result})
+
+    def estimated_document_count(self, *args, **kwargs):
+        return self._execute('count', {}, 'estimated_document_count', args, kwargs,
+            lambda result: {'n': result})
+
+    def distinct(self, key, filter = None, *args, **kwargs):
+        return self._execute('distinct', {'key': key, 'query': filter or {}}, 'distinct', (key, filter) + args, kwargs,
+            lambda result: {'values': list(result)})
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        pipeline = list(pipeline)
+        return self._execute('aggregate', {'pipeline': pipeline}, 'aggregate', (pipeline, ) + args, kwargs)
+
+    def drop(self, *args, **kwargs):
+        return self._execute('drop', {}, 'drop', args, kwargs)
+
+    def bulk_write(self, requests, ordered = True, *args, **kwargs):
+        requests = list(requests)
+        commands = _bulk_write_commands(self._collection.name, requests, ordered)
+
+        return _run_published(self._collection.database.name, commands, self._collection.bulk_write, (requests, ordered) + args, kwargs)
+
+    def create_index(self, keys, *args, **kwargs):
+        return self._execute('createIndexes', {'indexes': [{'key': keys}]}, 'create_index', (keys, ) + args, kwargs)
+
+    def create_indexes(self, indexes, *args, **kwargs):
+        indexes = list(indexes)
+        return self._execute('createIndexes', {'indexes': [getattr(index, 'document', index) for index in indexes]}, 'create_indexes',
+            (indexes, ) + args, kwargs)
+
+    def drop_index(self, index_or_name, *args, **kwargs):
+        return self._execute('dropIndexes', {'index': index_or_name}, 'drop_index', (index_or_name, ) + args, kwargs)
+
+    def drop_indexes(self, *args, **kwargs):
+        return self._execute('dropIndexes', {'index': '*'}, 'drop_indexes', args, kwargs)
+
+    def rename(self, new_name, *args, **kwargs):
+        database_name = self._collection.database.name
+        command = {'renameCollection': self._collection.full_name, 'to': '{0}.{1}'.format(database_name, new_name)}
+
+        # run on admin database, like pymongo's
+        return _run_published('admin', [('renameCollection', command)], self._collection.rename, (new_name, ) + args, kwargs)
+
+
+class MemoryDatabase(object):
+
+    """ Proxy to mongomock database, returning MemoryCollection for its collections """
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        value = getattr(self._database, name)
+
+        return MemoryCollection(value) if mongomock and isinstance(value, mongomock.Collection) else value
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def __eq__(self, other):
+        return self._database == getattr(other, '_database', other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._database.name)
+
+    def get_collection(self, name, codec_options = None, *args, **kwargs):
+        # mongomock only returns dict documents, e.g. not RawBSONDocument used by snapshots
+        if codec_options is not None and codec_options.document_class is not dict:
+            codec_options = None
+
+        return MemoryCollection(self._database.get_collection(name, codec_options, *args, **kwargs))
+
+    def create_collection(self, name, *args, **kwargs):
+        collection = _run_published(self._database.name, [('create', {'create': name})],
+            self._database.create_collection, (name, ) + args, kwargs)
+
+        return MemoryCollection(collection)
+
+    def drop_collection(self, name_or_collection, *args, **kwargs):
+        name = getattr(name_or_collection, 'name', name_or_collection)
+
+        return _run_published(self._database.name, [('drop', {'drop': name})],
+            self._database.drop_collection, (name, ) + args, kwargs)
+
+
+_MongoClientBase = mongomock.MongoClient if mongomock else object
+
+
+class MemoryMongoClient(_MongoClientBase):
+
+    """ mongomock client, used as mongoengine's mongo_client_class with 'memory' backend.
+
+    Operations on its collections are published to command listener, so query
+    assertions and dirty collection tracking keep working without a mongod.
+    """
+
+    def get_database(self, *args, **kwargs):
+        database = super(MemoryMongoClient, self).get_database(*args, **kwargs)
+
+        return MemoryDatabase(database)
+
+    def drop_database(self, name_or_database):
+        name_or_database = getattr(name_or_database, '_database', name_or_database)
+        name = getattr(name_or_database, 'name', name_or_database)
+
+        return _run_published(name, [('dropDatabase', {'dropDatabase': 1})],
+            super(MemoryMongoClient, self).drop_database, (name_or_database, ), {})
+
+
+def memory_mongo_settings(db_settings):
+    """ (dict) -> (dict)
+    return mongo settings connecting to MemoryMongoClient.
+    """
+    if not mongomock:
+        raise ImportError("mongomock must be installed to use TEST_ADDONS_BACKEND = 'memory'.")
+
+    return dict(db_settings, mongo_client_class = MemoryMongoClient)
+
+
+_fake_redis_servers = {}
+
+
+def memory_cache_settings(cache_settings):
+    """ (dict) -> (dict)
+    return django_redis cache settings connecting to in-memory fakeredis server.
+
+    Caches with same LOCATION share the fake server, the way they would share the real one.
+    """
+    if not fakeredis:
+        raise ImportError("fakeredis must be installed to use TEST_ADDONS_BACKEND = 'memory'.")
+
+    location = cache_settings.get('LOCATION')
+    location_key = tuple(location) if isinstance(location, (list, tuple)) else location
+
+    if location_key not in _fake_redis_servers:
+        _fake_redis_servers[location_key] = fakeredis.FakeServer()
+
+    options = dict(cache_settings.get('OPTIONS', {}))
+    options['CONNECTION_POOL_KWARGS'] = dict(options.get('CONNECTION_POOL_KWARGS', {}),
+        connection_class = fakeredis.FakeConnection, server = _fake_redis_servers[location_key])
+
+    return dict(cache_settings, OPTIONS = options)
@@ -1,4 +1,6 @@
 # inbuild python imports
+import itertools
+import os
 
 # inbuilt django imports
 
@@ -8,27 +10,39 @@ from django.conf import settings
 # inter-app imports
 
 # local imports
-from . import utils
+from . import backends, utils
+from .backends import LazyImport, is_memory_backend
+from .cleanup import MongoDirtyCleanup, Neo4jCleanup, Neo4jNamespaceLabel, RedisCleanup
+from .graph_fixtures import NODE, RELATIONSHIP, GraphFixtureLoader, read_fixture
+from .load import THREADS, LoadGenerator
+from .monitoring import (_timer, CapturedCommand, CommandSubscriber, GraphSubscriber, InstrumentedGraph, RedisSubscriber, command_listener, cypher_plan,
+    execution_time, explain, graph_listener, plan_stages, query_recorder, redis_args_size, redis_command_name, redis_recorder)
+from .performance import Baseline, LatencyStats, sample, timed_client_class
+from .snapshots import MongoSnapshot, Neo4jSnapshot, RedisSnapshot
+from .teardown import teardown_scope
+from .timing import timing_report
 
-try:
-    import mongoengine
-except ImportError:
-    mongoengine = None
+# drivers are imported on first use, see backends
+mongoengine = LazyImport('mongoengine')
+cache = LazyImport('django.core.cache', 'cache')
+APIClient = LazyImport('rest_framework.test', 'APIClient')
+neo4j = LazyImport('py2neo', 'neo4j')
 
 try:
-    from django.core.cache import cache
+    from django.test.utils import override_settings
 except ImportError:
-    cache = None
+    override_settings = None
 
-try:
-    from rest_framework.test import APIClient
-except ImportError:
-    APIClient = None
 
-try:
-    from py2neo import neo4j
-except ImportError:
-    neo4j = None
+def _assert_in_context(context, func, *args, **kwargs):
+    """ (object, callable, *object, **object) -> (object or NoneType)
+    return assertion 'context' to be used in with statement, or, if 'func' is given, call it inside context.
+    """
+    if func is None:
+        return context
+
+    with context:
+        func(*args, **kwargs)
 
 
 class MongoTestMixin(object):
@@ -36,14 +50,21 @@ class MongoTestMixin(object):
     """ Mixin to enforce use of mongodb, instead of relational database, in testing  """
 
     CLEAR_CACHE = False
+    PERSISTENT_CONNECTION = True
+    MONGO_CLEANUP_STRATEGY = 'dirty'
+    MONGO_ISOLATION = 'cleanup'
+
+    mongo_cleanup = None
+    mongo_snapshot = None
+    mongo_session = None
+    mongo_transactions = False
 
     @classmethod
     def setUpClass(cls):
-        if not mongoengine:
-            raise ImportError("Mongoengine must be installed to use MongoTestCase.")
+        backends.load_backend('mongo')
 
         try:
-            cls.MONGO_DB_SETTINGS = settings.TEST_MONGO_DATABASE
+            cls.MONGO_DB_SETTINGS = utils.worker_mongo_settings(settings.TEST_MONGO_DATABASE)
         except:
             raise AttributeError("settings file has no attribute 'TEST_MONGO_DATABASE'. Specify TEST_MONGO_DATABASE in settings file. E.g: {'DB_NAME': 'test', 'HOST': ['localhost'], 'PORT': 27017}")
 
@@ -51,26 +72,167 @@ class MongoTestMixin(object):
             if not cache:
                 raise AttributeError("CACHE settings are not configured in settings, yet.")
 
+        if cls.MONGO_CLEANUP_STRATEGY not in ('dirty', 'drop'):
+            raise ValueError("MONGO_CLEANUP_STRATEGY must be either 'dirty' or 'drop', not {0!r}.".format(cls.MONGO_CLEANUP_STRATEGY))
+
+        if cls.MONGO_ISOLATION not in ('cleanup', 'transaction'):
+            raise ValueError("MONGO_ISOLATION must be either 'cleanup' or 'transaction', not {0!r}.".format(cls.MONGO_ISOLATION))
+
+        # mongomock has no transactions, in-memory cleanup is cheap anyway
+        cls.mongo_transactions = cls.MONGO_ISOLATION == 'transaction' and not is_memory_backend()
+
+        if is_memory_backend():
+            backends.load_backend('memory')
+
+            from .memory import memory_mongo_settings
+            cls.MONGO_DB_SETTINGS = memory_mongo_settings(cls.MONGO_DB_SETTINGS)
+
+        cls._connect_mongo()
+
+        if cls.mongo_transactions and not utils.supports_transactions(mongoengine.connection.get_connection()):
+            raise AttributeError("MONGO_ISOLATION = 'transaction' requires TEST_MONGO_DATABASE to be a replica set (a single node one will do) or sharded cluster.")
+
+        # writes made outside of test transaction are still tracked, to clean them up
+        if cls.MONGO_CLEANUP_STRATEGY == 'dirty' or cls.mongo_transactions:
+            cls.mongo_cleanup = MongoDirtyCleanup.for_database(cls.MONGO_DB_SETTINGS['db'])
+            cls.mongo_cleanup.reset_database(mongoengine.connection.get_db())
+
+        if cls.mongo_transactions:
+            utils.ensure_collections()
+
         super(MongoTestMixin, cls).setUpClass()
 
-    def _pre_setup(self):
+    @classmethod
+    def _connect_mongo(cls):
         """ (MongoTestMixin) -> (NoneType)
-        create a new mongo connection.
+        make sure mongoengine aliases are connected to test database.
+
+        With PERSISTENT_CONNECTION (default) the pooled process wide connection is
+        reused, otherwise a new mongo connection is created on every call.
         """
+        if cls.PERSISTENT_CONNECTION:
+            utils.connect_pooled(cls.MONGO_DB_SETTINGS)
+        else:
+            utils.disconnect()
+            options = dict(cls.MONGO_DB_SETTINGS, event_listeners = [command_listener.pymongo_listener()])
+            mongoengine.connection.connect(options.pop('db'), **options)
+
+    @classmethod
+    def _snapshot_test_data(cls):
+        super(MongoTestMixin, cls)._snapshot_test_data()
+
+        cls.mongo_snapshot = MongoSnapshot(mongoengine.connection.get_db()).take()
+
+        if cls.mongo_cleanup:
+            cls.mongo_cleanup.clear()
+
+    @classmethod
+    def _discard_test_data(cls):
+        super(MongoTestMixin, cls)._discard_test_data()
+
+        if not cls.mongo_snapshot:
+            return
+
+        cls._connect_mongo()
+
+        if cls.MONGO_CLEANUP_STRATEGY == 'dirty':
+            cls.mongo_snapshot.discard()
+            cls.mongo_cleanup.clear()
+        else:
+            mongoengine.connection.get_connection().drop_database(cls.MONGO_DB_SETTINGS['db'])
+
+        cls.mongo_snapshot = None
+
+    def _pre_setup(self):
         super(MongoTestMixin, self)._pre_setup()
+        self._setup_mongo()
+
+    def _setup_mongo(self):
+        with timing_report.phase(self, 'mongo.setup'):
+            self._connect_mongo()
+
+            if self._uses_mongo_transaction():
+                self._start_mongo_transaction()
+
+    def _uses_mongo_transaction(self):
+        test_method = getattr(self, self._testMethodName, None)
+
+        return self.mongo_transactions and getattr(test_method, 'mongo_transaction', True)
+
+    def _start_mongo_transaction(self):
+        """ (MongoTestMixin) -> (NoneType)
+        start transaction in a new client session and bind it to operations of current thread.
+        """
+        self.mongo_session = mongoengine.connection.get_connection().start_session()
+        self.mongo_session.start_transaction()
+        self.mongo_cleanup.ignore_transaction(self.mongo_session)
+        utils.bind_session(self.mongo_session)
+
+    def _abort_mongo_transaction(self):
+        """ (MongoTestMixin) -> (bool)
+        abort test transaction, if any, return True if there was one.
+        """
+        if not self.mongo_session:
+            return False
 
-        utils.disconnect()
-        mongoengine.connection.connect(self.MONGO_DB_SETTINGS['db'], host = self.MONGO_DB_SETTINGS['host'], port = self.MONGO_DB_SETTINGS['port'])
+        try:
+            utils.bind_session(None)
+
+            if self.mongo_session.in_transaction:
+                self.mongo_session.abort_transaction()
+        finally:
+            self.mongo_cleanup.ignore_transaction(None)
+            self.mongo_session.end_session()
+            self.mongo_session = None
+
+        return True
 
     def _post_teardown(self):
-        super(MongoTestMixin, self)._post_teardown()
+        """ (MongoTestMixin) -> (NoneType)
+        clean test database.
+
+        With 'transaction' MONGO_ISOLATION test transaction is aborted first, and
+        cleanup below only deals with writes made outside of it.
+
+        With 'dirty' MONGO_CLEANUP_STRATEGY (default) only collections written during
+        the test are emptied, keeping their indexes. With 'drop' the whole
+        database is dropped. Collections in setUpTestData snapshot are then
+        restored from it.
+
+        Cleanup runs concurrently with cleanups of other backends of the test case.
+        With CLEAR_CACHE cache is cleared before any of them starts.
+        """
+        with teardown_scope(self) as teardown:
+            super(MongoTestMixin, self)._post_teardown()
+
+            # session is bound to current thread, so transaction is aborted here
+            rolled_back = self._abort_mongo_transaction()
+            teardown.add('mongo', self._clean_mongo, rolled_back)
+
+            if self.CLEAR_CACHE:
+                # clearing redis backed cache must not race redis cleanup restoring setUpTestData keys
+                teardown.add_first('cache', cache.clear)
+
+    def _clean_mongo(self, rolled_back):
+        if self.MONGO_CLEANUP_STRATEGY == 'dirty':
+            database_dropped = self.mongo_cleanup.database_dropped
+            cleaned_collections, dropped_collections = self.mongo_cleanup.clean(mongoengine.connection.get_db())
 
-        connection = mongoengine.connection.get_connection()
-        connection.drop_database(self.MONGO_DB_SETTINGS['db'])
-        utils.disconnect()
+            if self.mongo_snapshot and (cleaned_collections or database_dropped):
+                self.mongo_snapshot.restore(cleaned_collections, dropped_collections)
+                self.mongo_cleanup.clear()
+        elif not rolled_back or self.mongo_cleanup.dirty:
+            connection = mongoengine.connection.get_connection()
+            connection.drop_database(self.MONGO_DB_SETTINGS['db'])
 
-        if self.CLEAR_CACHE:
-            cache.clear()
+            if self.mongo_cleanup:
+                self.mongo_cleanup.clear()
+
+            if self.mongo_snapshot:
+                self.mongo_snapshot.restore()
+
+        if not self.PERSISTENT_CONNECTION:
+            utils.disconnect()
 
     def assertNumQueries(self, num, func = None, *args, **kwargs):
         context_manager = _AssertNumQueries
@@ -80,126 +242,882 @@ class MongoTestMixin(object):
         context_manager = _AssertMaxNumQueries
         return self._assert_num_queries(context_manager, num, func, *args, **kwargs)
 
+    def assertUsesIndex(self, index_name = None, func = None, *args, **kwargs):
+        """ assert every explainable query in context is served by an index ('index_name', if given). """
+        return _assert_in_context(_AssertUsesIndex(self, index_name), func, *args, **kwargs)
+
+    def assertNoCollectionScan(self, func = None, *args, **kwargs):
+        return _assert_in_context(_AssertNoCollectionScan(self), func, *args, **kwargs)
+
+    def assertMaxQueryTime(self, milliseconds, func = None, *args, **kwargs):
+        """ assert no query in context takes longer than 'milliseconds'.
+
+        Pass explain = True to compare server side execution time reported by
+        explain, instead of round trip time measured by client.
+        """
+        explain = kwargs.pop('explain', False)
+        return _assert_in_context(_AssertMaxQueryTime(self, milliseconds, explain), func, *args, **kwargs)
+
     def _assert_num_queries(self, context_manager, num, func, *args, **kwargs):
-        context = context_manager(self, num)
+        return _assert_in_context(context_manager(self, num), func, *args, **kwargs)
 
-        if func is None:
-            return context
 
-        with context:
-            func(*args, **kwargs)
+class _CaptureQueries(CommandSubscriber):
 
+    """ Context Manager capturing mongodb commands issued to test database from current thread.
 
-class _AssertNumQueries(object):
-    """ Context Manager to count number of mongodb queries and assert equality to expected value """
+    Capturing is done in process by pymongo command monitoring, server
+    profiler is left untouched. Context returns list of CapturedCommand.
+    """
 
-    def __init__(self, test_case, num_of_queries):
+    def __init__(self, test_case):
         self.test_case = test_case
-        self.num_of_queries = num_of_queries
         self.db = mongoengine.connection.get_db()
+        self.captured_queries = []
+        self._pending = {}
 
     def __enter__(self):
-        """ (_AssertNumQueries) -> (int)
-        drop any existing profiling data,
-        set profiling_level to profile everything, and issue a request to profile.find which
-        instantiates the change.
-        """
-        self.db.set_profiling_level(0)
-        self.db.system.profile.drop()
-        self.db.set_profiling_level(2)
-        return self
+        """ (_CaptureQueries) -> (list)
+        start capturing commands, return list which is filled with captured commands.
+        """
+        self.captured_queries = []
+        self._pending = {}
+        query_recorder.push(self)
+        return self.captured_queries
 
     def __exit__(self, type, value, traceback):
-        actual_num_of_queries = self._count()
-        self.test_case.assertEqual(actual_num_of_queries, self.num_of_queries, "{0} query executed, {1} query expected".format(actual_num_of_queries, self.num_of_queries))
+        query_recorder.pop(self)
+
+        if type is not None:
+            return
+
+        self._assert()
+
+    def _assert(self):
+        pass
+
+    def started(self, event):
+        if event.database_name == self.db.name:
+            captured_command = CapturedCommand(event)
+            self.captured_queries.append(captured_command)
+            self._pending[(event.connection_id, event.request_id)] = captured_command
+
+    def succeeded(self, event):
+        captured_command = self._pending.pop((event.connection_id, event.request_id), None)
+
+        if captured_command:
+            captured_command.succeeded(event)
+
+    def failed(self, event):
+        captured_command = self._pending.pop((event.connection_id, event.request_id), None)
 
-        self.db.set_profiling_level(0)
+        if captured_command:
+            captured_command.failed(event)
 
     def _count(self):
-        """ (_AssertNumQueries) -> (int)
+        """ (_CaptureQueries) -> (int)
         return number_of_queries executed in context.
+        """
+        return len(self.captured_queries)
 
-        1 is subtracted, since any request to db.system.profile is itself a query.
+    def _explained_queries(self, verbosity = 'queryPlanner'):
+        """ (_CaptureQueries, str) -> (list)
+        return list of (captured_command, explain_output) for every explainable captured command.
         """
-        ignore_query  = {
-            "command.count": {"$ne": "system.profile"},
-            "ns": {"$ne": "{0}.system.indexes".format(self.db.name)}
-        }
+        return [(query, explain(self.db, query, verbosity)) for query in self.captured_queries if query.explainable]
+
+    def _report(self, queries = None):
+        queries = self.captured_queries if queries is None else queries
+        return '\n'.join('    {0}. {1}'.format(number, query) for number, query in enumerate(queries, 1))
+
+
+class _AssertNumQueries(_CaptureQueries):
+
+    """ Context Manager to count number of mongodb queries and assert equality to expected value """
 
-        count = self.db.system.profile.find(ignore_query).count()
+    def __init__(self, test_case, num_of_queries):
+        super(_AssertNumQueries, self).__init__(test_case)
+        self.num_of_queries = num_of_queries
 
-        return count
+    def _assert(self):
+        actual_num_of_queries = self._count()
+        self.test_case.assertEqual(actual_num_of_queries, self.num_of_queries, "{0} query executed, {1} query expected\n{2}".format(actual_num_of_queries, self.num_of_queries, self._report()))
 
 
 class _AssertMaxNumQueries(_AssertNumQueries):
 
     """ Context Managers to count number of mongodb queries and assert max limit """
 
-    def __exit__(self, type, value, traceback):
+    def _assert(self):
         actual_num_of_queries = self._count()
-        self.test_case.assertLessEqual(actual_num_of_queries, self.num_of_queries, "{0} query executed, maximum {1} query expected".format(actual_num_of_queries, self.num_of_queries))
+        self.test_case.assertLessEqual(actual_num_of_queries, self.num_of_queries, "{0} query executed, maximum {1} query expected\n{2}".format(actual_num_of_queries, self.num_of_queries, self._report()))
 
-        self.db.set_profiling_level(0)
+
+class _AssertUsesIndex(_CaptureQueries):
+
+    """ Context Manager to assert queries are served by an index, using explain """
+
+    def __init__(self, test_case, index_name = None):
+        super(_AssertUsesIndex, self).__init__(test_case)
+        self.index_name = index_name
+
+    def _assert(self):
+        failing_queries = []
+
+        for query, explain_output in self._explained_queries():
+            used_indexes = [index_name for stage, index_name in plan_stages(explain_output) if stage in ('IXSCAN', 'IDHACK', 'EXPRESS_IXSCAN') or index_name]
+
+            if not used_indexes or (self.index_name and self.index_name not in used_indexes):
+                failing_queries.append(query)
+
+        expected = "index '{0}'".format(self.index_name) if self.index_name else 'an index'
+        if failing_queries:
+            self.test_case.fail("{0} query not using {1}\n{2}".format(len(failing_queries), expected, self._report(failing_queries)))
+
+
+class _AssertNoCollectionScan(_CaptureQueries):
+
+    """ Context Manager to assert no query does a full collection scan, using explain """
+
+    def _assert(self):
+        failing_queries = [query for query, explain_output in self._explained_queries() if 'COLLSCAN' in [stage for stage, index_name in plan_stages(explain_output)]]
+        if failing_queries:
+            self.test_case.fail("{0} query doing collection scan\n{1}".format(len(failing_queries), self._report(failing_queries)))
+
+
+class _AssertMaxQueryTime(_CaptureQueries):
+
+    """ Context Manager to assert maximum time taken by any query """
+
+    def __init__(self, test_case, milliseconds, explain = False):
+        super(_AssertMaxQueryTime, self).__init__(test_case)
+        self.milliseconds = milliseconds
+        self.explain = explain
+
+    def _assert(self):
+        if self.explain:
+            timings = [(query, execution_time(explain_output)) for query, explain_output in self._explained_queries('executionStats')]
+        else:
+            timings = [(query, query.duration or 0) for query in self.captured_queries]
+
+        failing_queries = [query for query, duration in timings if duration > self.milliseconds]
+        if failing_queries:
+            self.test_case.fail("{0} query took more than {1}ms\n{2}".format(len(failing_queries), self.milliseconds, self._report(failing_queries)))
 
 
 class Neo4jTestMixin(object):
 
-    """ Mixin to enforce use of mongodb, instead of relational database, in testing  """
+    """ Mixin to enforce use of mongodb, instead of relational database, in testing
+
+    NEO4J_CLEANUP_STRATEGY decides how graph is cleaned after each test:
+        'batched' (default) - entities created through Graph.create are
+            deleted by id, if any other write was issued every node is deleted,
+            in batches of NEO4J_CLEANUP_BATCH_SIZE.
+        'namespace' - every test gets its own label in self.NEO4J_NAMESPACE
+            (e.g. 'TestRun_1234_5') and only nodes with it are deleted. If any
+            write other than Graph.create was issued, setUpTestData nodes are
+            replaced by their snapshot too.
+        'delete' - every node and relationship is deleted in single query.
+    Writes are seen whether they go through self.graph_db or any other py2neo
+    Graph, e.g. application's own. Cleanup is skipped if no write was issued,
+    except with 'delete' strategy.
+
+    Inside django's parallel test runner workers only nodes labeled with
+    NEO4J_NAMESPACE (e.g. 'TestWorker_3', unless test class sets its own) are
+    deleted after each test.
+
+    New nodes passed to Graph.create, in setUpTestData or tests, get NEO4J_NAMESPACE
+    label automatically. Nodes created by cypher statements must carry it themselves,
+    isolation of those is opt-in.
+    """
+
+    NEO4J_NAMESPACE = None
+    NEO4J_CLEANUP_STRATEGY = 'batched'
+    NEO4J_CLEANUP_BATCH_SIZE = Neo4jCleanup.BATCH_SIZE
+    NEO4J_FIXTURE_BATCH_SIZE = GraphFixtureLoader.BATCH_SIZE
+
+    neo4j_snapshot = None
+
+    _test_run_counter = itertools.count(1)
 
     @classmethod
     def setUpClass(cls):
-        if not neo4j:
-            raise ImportError('Neo4j package must be installed to use Neo4j test cases.')
+        backends.load_backend('neo4j')
+
         try:
             cls.NEO4J_LINK = settings.NEO4J_TEST_LINK
         except AttributeError:
             raise AttributeError("settings file has no attribute 'NEO4J_TEST_LINK'. Specify NEO4J_TEST_LINK in settings file. E.g: NEO4J_TEST_LINK = 'http://localhost:7474/db/data'")
 
-        super(Neo4jTestMixin, cls).setUpClass()
+        if cls.NEO4J_CLEANUP_STRATEGY not in ('batched', 'namespace', 'delete'):
+            raise ValueError("NEO4J_CLEANUP_STRATEGY must be one of 'batched', 'namespace' or 'delete', not {0!r}.".format(cls.NEO4J_CLEANUP_STRATEGY))
+
+        if cls.NEO4J_NAMESPACE is None:
+            cls.NEO4J_NAMESPACE = utils.worker_name('TestWorker')
+
+        cls.graph_db = InstrumentedGraph(neo4j.Graph(cls.NEO4J_LINK))
+        graph_listener.instrument(cls.graph_db.graph)
+
+        # label nodes created in setUpTestData
+        namespace_label = Neo4jNamespaceLabel(cls.NEO4J_NAMESPACE) if cls.NEO4J_NAMESPACE else None
+
+        if namespace_label:
+            graph_listener.subscribe(namespace_label)
+
+        try:
+            super(Neo4jTestMixin, cls).setUpClass()
+        finally:
+            if namespace_label:
+                graph_listener.unsubscribe(namespace_label)
+
+    @classmethod
+    def _snapshot_test_data(cls):
+        super(Neo4jTestMixin, cls)._snapshot_test_data()
+
+        cls.neo4j_snapshot = Neo4jSnapshot(cls.graph_db.graph, cls.NEO4J_NAMESPACE).take()
+
+    @classmethod
+    def _discard_test_data(cls):
+        super(Neo4jTestMixin, cls)._discard_test_data()
+
+        if cls.neo4j_snapshot:
+            Neo4jCleanup(cls.graph_db.graph, cls.NEO4J_NAMESPACE, cls.NEO4J_CLEANUP_BATCH_SIZE).delete_all()
+            cls.neo4j_snapshot = None
 
     def _pre_setup(self):
         super(Neo4jTestMixin, self)._pre_setup()
 
-        self.graph_db = neo4j.Graph(self.NEO4J_LINK)
+        with timing_report.phase(self, 'neo4j.setup'):
+            if self.NEO4J_CLEANUP_STRATEGY == 'namespace':
+                self.NEO4J_NAMESPACE = 'TestRun_{0}_{1}'.format(os.getpid(), next(self._test_run_counter))
+
+            graph = neo4j.Graph(self.NEO4J_LINK)
+            self.neo4j_cleanup = Neo4jCleanup(graph, self.NEO4J_NAMESPACE, self.NEO4J_CLEANUP_BATCH_SIZE)
+            self._graph_subscribers = [self.neo4j_cleanup]
+
+            if self.NEO4J_NAMESPACE:
+                self._graph_subscribers.append(Neo4jNamespaceLabel(self.NEO4J_NAMESPACE))
+
+            for subscriber in self._graph_subscribers:
+                graph_listener.subscribe(subscriber)
+            self.graph_db = InstrumentedGraph(graph, [timing_report] if timing_report.enabled else [])
 
     def _post_teardown(self):
-        super(Neo4jTestMixin, self)._post_teardown()
+        with teardown_scope(self) as teardown:
+            super(Neo4jTestMixin, self)._post_teardown()
+
+            teardown.add('neo4j', self._clean_neo4j)
+
+    def _clean_neo4j(self):
+        # statements of cleanup and snapshot restore are not writes of the test
+        for subscriber in self._graph_subscribers:
+            graph_listener.unsubscribe(subscriber)
+
+        if self.NEO4J_CLEANUP_STRATEGY != 'delete':
+            deleted_all = self.neo4j_cleanup.dirty and self.neo4j_cleanup.clean()
+
+            if self.neo4j_snapshot and deleted_all:
+                if self.NEO4J_CLEANUP_STRATEGY == 'namespace':
+                    # per test namespace never covers nodes created in setUpTestData, which untracked
+                    # write may have changed too, so they are replaced by snapshot as well
+                    Neo4jCleanup(self.neo4j_cleanup.graph, type(self).NEO4J_NAMESPACE, self.NEO4J_CLEANUP_BATCH_SIZE).delete_all()
+
+                self.neo4j_snapshot.restore()
+
+            return
+
+        label = ':{0}'.format(self.NEO4J_NAMESPACE) if self.NEO4J_NAMESPACE else ''
+        self.graph_db.graph.cypher.execute('MATCH (n{0}) DETACH DELETE n'.format(label))
+
+        if self.neo4j_snapshot:
+            self.neo4j_snapshot.restore()
+
+    def load_graph_fixture(self, path = None, nodes = (), relationships = (), records = (), batch_size = None):
+        """ (Neo4jTestMixin, str, iterable, iterable, iterable, int) -> (GraphLoadReport)
+        load graph fixture file at 'path' (see graph_fixtures.read_fixture), then 'nodes'
+        as (key, labels, properties), 'relationships' as (start key, type, end key, properties)
+        and tagged 'records', through self.graph_db in batched UNWIND statements.
+
+        Returned report has number of entities loaded and throughput achieved, time taken
+        is also added to 'neo4j.fixtures' phase of timing report.
+        """
+        records = itertools.chain(
+            read_fixture(path) if path else (),
+            ((NODE, ) + tuple(node) for node in nodes),
+            ((RELATIONSHIP, ) + tuple(relationship) for relationship in relationships),
+            records)
+
+        loader = GraphFixtureLoader(self.graph_db, batch_size or self.NEO4J_FIXTURE_BATCH_SIZE, self.NEO4J_NAMESPACE)
+        report = loader.load(records)
+        timing_report.add(self, 'neo4j.fixtures', report.seconds)
+
+        return report
+
+    def assertNumCypherQueries(self, num, func = None, *args, **kwargs):
+        """ assert exactly 'num' cypher statements are issued through self.graph_db.
+
+        Pass profile = True to capture execution plan of every statement in 'plan' attribute.
+        """
+        profile = kwargs.pop('profile', False)
+        return _assert_in_context(_AssertNumCypherQueries(self, num, profile), func, *args, **kwargs)
+
+    def assertMaxCypherQueries(self, num, func = None, *args, **kwargs):
+        profile = kwargs.pop('profile', False)
+        return _assert_in_context(_AssertMaxCypherQueries(self, num, profile), func, *args, **kwargs)
+
+    def assertMaxCypherTime(self, milliseconds, func = None, *args, **kwargs):
+        """ assert no cypher statement issued through self.graph_db takes longer than 'milliseconds'. """
+        profile = kwargs.pop('profile', False)
+        return _assert_in_context(_AssertMaxCypherTime(self, milliseconds, profile), func, *args, **kwargs)
+
+
+class _CaptureCypherQueries(GraphSubscriber):
+
+    """ Context Manager capturing cypher statements issued through test case's graph_db.
+
+    Context returns list of CypherQuery, having statement, parameters, duration (ms),
+    rows and, if profile is True, plan.
+    """
+
+    def __init__(self, test_case, num, profile = False):
+        self.test_case = test_case
+        self.num = num
+        self.profile = profile
+        self.captured_queries = []
+
+    def __enter__(self):
+        self.captured_queries = []
+        self.test_case.graph_db.subscribers.append(self)
+        return self.captured_queries
+
+    def __exit__(self, type, value, traceback):
+        self.test_case.graph_db.subscribers.remove(self)
+
+        if type is not None:
+            return
+
+        if self.profile:
+            for query in self.captured_queries:
+                query.plan = cypher_plan(self.test_case.graph_db.graph, query)
+
+        self._assert()
+
+    def _assert(self):
+        pass
+
+    def cypher_executed(self, query):
+        self.captured_queries.append(query)
+
+    def _report(self, queries = None):
+        queries = self.captured_queries if queries is None else queries
+        return '\n'.join('    {0}. {1}'.format(number, query) for number, query in enumerate(queries, 1))
+
+
+class _AssertNumCypherQueries(_CaptureCypherQueries):
+
+    """ Context Manager to count number of cypher queries and assert equality to expected value """
+
+    def _assert(self):
+        num_of_queries = len(self.captured_queries)
+        self.test_case.assertEqual(num_of_queries, self.num, "{0} cypher query executed, {1} query expected\n{2}".format(num_of_queries, self.num, self._report()))
+
+
+class _AssertMaxCypherQueries(_CaptureCypherQueries):
+
+    """ Context Manager to count number of cypher queries and assert max limit """
+
+    def _assert(self):
+        num_of_queries = len(self.captured_queries)
+        self.test_case.assertLessEqual(num_of_queries, self.num, "{0} cypher query executed, maximum {1} query expected\n{2}".format(num_of_queries, self.num, self._report()))
 
-        query = '''
-        START n = node(*)
-        OPTIONAL MATCH n-[r]-()
-        DELETE n, r;
-        '''
 
-        self.graph_db.cypher.execute(query)
+class _AssertMaxCypherTime(_CaptureCypherQueries):
+
+    """ Context Manager to assert maximum time taken by any cypher query """
+
+    def _assert(self):
+        failing_queries = [query for query in self.captured_queries if (query.duration or 0) > self.num]
+
+        if failing_queries:
+            self.test_case.fail("{0} cypher query took more than {1}ms\n{2}".format(len(failing_queries), self.num, self._report(failing_queries)))
 
 
 class RedisTestMixin(object):
 
+    """ Mixin to clear redis databases configured in CACHES after each test
+
+    With 'tracked' REDIS_CLEANUP_STRATEGY (default) only keys written during the
+    test are deleted, once per (host, port, db), with 'flush' every configured
+    database is flushed.
+
+    Inside django's parallel test runner workers every cache gets a per worker
+    KEY_PREFIX (e.g. 'test_3') and only keys with that prefix are deleted,
+    instead of flushing databases shared with other workers.
+    """
+
+    REDIS_CLEANUP_STRATEGY = 'tracked'
+
+    redis_snapshot = None
+
     @classmethod
     def setUpClass(cls):
+        cls.REDIS_KEY_PREFIXES = None
+
+        if cls.REDIS_CLEANUP_STRATEGY not in ('tracked', 'flush'):
+            raise ValueError("REDIS_CLEANUP_STRATEGY must be either 'tracked' or 'flush', not {0!r}.".format(cls.REDIS_CLEANUP_STRATEGY))
+
+        django_redis, = backends.load_backend('redis')
+
         try:
-            from django_redis import get_redis_connection
-            cls.redis_connections = [get_redis_connection(connection_name) for connection_name in list(settings.CACHES.keys())]
-        except ImportError as exc:
-            raise ImportError("django_redis must be installed to use RedisTestCase. Exception details:- {0}".format(repr(exc)))
+            if is_memory_backend():
+                cls._enable_memory_caches()
+            elif utils.get_worker_id() is not None:
+                cls._enable_worker_key_prefixes()
+
+            cls.redis_connections = [django_redis.get_redis_connection(connection_name) for connection_name in list(settings.CACHES.keys())]
         except AttributeError as exc:
             raise AttributeError("settings file doesn't have redis configuration defined. Define CACHES in test settings file. Exception details:- {0}".format(repr(exc)))
 
+        cls.redis_cleanup = RedisCleanup(cls.redis_connections, cls.REDIS_KEY_PREFIXES)
+        cls.redis_cleanup.reset()
+
+        if cls.REDIS_CLEANUP_STRATEGY == 'tracked':
+            cls.redis_cleanup.start()
+
         super(RedisTestMixin, cls).setUpClass()
 
+    @classmethod
+    def _snapshot_test_data(cls):
+        super(RedisTestMixin, cls)._snapshot_test_data()
+
+        cls.redis_snapshot = RedisSnapshot(cls.redis_cleanup.targets).take()
+        cls.redis_cleanup.forget()
+
+    @classmethod
+    def _discard_test_data(cls):
+        super(RedisTestMixin, cls)._discard_test_data()
+
+        if cls.redis_snapshot:
+            cls.redis_snapshot.discard()
+            cls.redis_cleanup.forget()
+            cls.redis_snapshot = None
+
+    @classmethod
+    def _enable_worker_key_prefixes(cls):
+        caches = {}
+
+        for connection_name, cache_settings in settings.CACHES.items():
+            key_prefix = ':'.join(prefix for prefix in (cache_settings.get('KEY_PREFIX'), utils.worker_name()) if prefix)
+            caches[connection_name] = dict(cache_settings, KEY_PREFIX = key_prefix)
+
+        cls.REDIS_KEY_PREFIXES = [caches[connection_name]['KEY_PREFIX'] for connection_name in list(settings.CACHES.keys())]
+        cls._override_caches(caches)
+
+    @classmethod
+    def _enable_memory_caches(cls):
+        """ (RedisTestMixin) -> (NoneType)
+        point django_redis caches to in-memory fakeredis servers, for 'memory' TEST_ADDONS_BACKEND.
+        """
+        backends.load_backend('memory')
+
+        from .memory import memory_cache_settings
+
+        caches = {}
+
+        for connection_name, cache_settings in settings.CACHES.items():
+            if 'django_redis' in cache_settings.get('BACKEND', ''):
+                cache_settings = memory_cache_settings(cache_settings)
+
+            caches[connection_name] = cache_settings
+
+        cls._override_caches(caches)
+
+    @classmethod
+    def _override_caches(cls, caches):
+        cls._caches_override = override_settings(CACHES = caches)
+        cls._caches_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(RedisTestMixin, cls).tearDownClass()
+
+        cls.redis_cleanup.stop()
+
+        if getattr(cls, '_caches_override', None):
+            cls._caches_override.disable()
+            del cls._caches_override
+
     def _post_teardown(self):
-        super(RedisTestMixin, self)._post_teardown()
-        [connection.flushdb() for connection in self.redis_connections]
+        with teardown_scope(self) as teardown:
+            super(RedisTestMixin, self)._post_teardown()
+
+            teardown.add('redis', self._clean_redis)
+
+    def _clean_redis(self):
+        if self.REDIS_CLEANUP_STRATEGY == 'tracked':
+            cleaned = self.redis_cleanup.clean()
+        else:
+            cleaned = self.redis_cleanup.flush()
+
+        if self.redis_snapshot and cleaned:
+            self.redis_snapshot.restore(cleaned)
+
+    def assertNumRedisCommands(self, num, func = None, *args, **kwargs):
+        return _assert_in_context(_AssertNumRedisCommands(self, num), func, *args, **kwargs)
+
+    def assertMaxRedisCommands(self, num, func = None, *args, **kwargs):
+        return _assert_in_context(_AssertMaxRedisCommands(self, num), func, *args, **kwargs)
+
+    def assertMaxRoundTrips(self, num, func = None, *args, **kwargs):
+        """ assert at most 'num' round trips to redis, whole pipeline being one round trip. """
+        return _assert_in_context(_AssertMaxRoundTrips(self, num), func, *args, **kwargs)
+
+
+class _CaptureRedisCommands(RedisSubscriber):
+
+    """ Context Manager capturing redis round trips made from current thread.
+
+    Context returns list of RedisRoundTrip, each having list of commands sent.
+    """
+
+    def __init__(self, test_case, num):
+        self.test_case = test_case
+        self.num = num
+        self.round_trips = []
+
+    def __enter__(self):
+        self.round_trips = []
+        redis_recorder.push(self)
+        return self.round_trips
+
+    def __exit__(self, type, value, traceback):
+        redis_recorder.pop(self)
+
+        if type is not None:
+            return
+
+        self._assert()
+
+    def _assert(self):
+        pass
+
+    def redis_round_trip(self, round_trip):
+        self.round_trips.append(round_trip)
+
+    def _num_of_commands(self):
+        return sum(len(round_trip.commands) for round_trip in self.round_trips)
+
+    def _report(self):
+        lines = []
+
+        for number, round_trip in enumerate(self.round_trips, 1):
+            duration = '?' if round_trip.duration is None else '{0:.2f}'.format(round_trip.duration)
+            lines.append('    round trip {0} ({1}ms):'.format(number, duration))
+
+            for args in round_trip.commands:
+                key = args[1] if len(args) > 1 else ''
+                lines.append('        {0} {1!r} {2} bytes'.format(redis_command_name(args), key, redis_args_size(args)))
+
+        return '\n'.join(lines)
+
+
+class _AssertNumRedisCommands(_CaptureRedisCommands):
+
+    """ Context Manager to count number of redis commands and assert equality to expected value """
+
+    def _assert(self):
+        num_of_commands = self._num_of_commands()
+        self.test_case.assertEqual(num_of_commands, self.num, "{0} redis commands executed, {1} expected\n{2}".format(num_of_commands, self.num, self._report()))
+
+
+class _AssertMaxRedisCommands(_CaptureRedisCommands):
+
+    """ Context Manager to count number of redis commands and assert max limit """
+
+    def _assert(self):
+        num_of_commands = self._num_of_commands()
+        self.test_case.assertLessEqual(num_of_commands, self.num, "{0} redis commands executed, maximum {1} expected\n{2}".format(num_of_commands, self.num, self._report()))
+
+
+class _AssertMaxRoundTrips(_CaptureRedisCommands):
+
+    """ Context Manager to count number of round trips to redis and assert max limit """
+
+    def _assert(self):
+        num_of_round_trips = len(self.round_trips)
+        self.test_case.assertLessEqual(num_of_round_trips, self.num, "{0} redis round trips made, maximum {1} expected\n{2}".format(num_of_round_trips, self.num, self._report()))
 
 
 class ApiTestMixin(object):
 
+    """ Mixin to use rest framework's APIClient, timing every request, as self.client
+
+    assertResponseTime and assertThroughput compare measured performance with
+    PERFORMANCE_BASELINE_FILE too, if set, allowing PERFORMANCE_TOLERANCE regression.
+    """
+
     client_class = APIClient
+    PERFORMANCE_BASELINE_FILE = None
+    PERFORMANCE_TOLERANCE = 0.2
 
     @classmethod
     def setUpClass(cls):
-        if not cls.client_class:
-            raise ImportError('django rest framework is required to use API test cases.')
+        rest_framework_test, = backends.load_backend('api')
+
+        cls.client_class = timed_client_class(rest_framework_test.APIClient if cls.client_class is APIClient else cls.client_class)
 
         super(ApiTestMixin, cls).setUpClass()
+
+    def assertQueryBudget(self, func = None, *args, **kwargs):
+        """ assert context issues at most 'sql' queries, 'mongo' queries, 'redis' commands and 'cypher'
+        statements, and takes at most 'total_ms' milliseconds (wall clock), None meaning no limit.
+
+        Budgets are keyword only, so positional arguments are passed to func, e.g.
+        self.assertQueryBudget(self.client.get, '/books/', sql = 0, mongo = 2).
+
+        Every backend of the test case is captured at once, whether it has a budget or not,
+        and failure message breaks queries and time down per backend. SQL queries are
+        captured on connections in 'databases' of the test case.
+        """
+        budgets = [kwargs.pop(name, None) for name in ('sql', 'mongo', 'redis', 'cypher', 'total_ms')]
+
+        return _assert_in_context(_AssertQueryBudget(self, *budgets), func, *args, **kwargs)
+
+    def assertResponseTime(self, milliseconds, func, *args, **kwargs):
+        """ assert 'percentile' (default 95) of time taken by func(*args, **kwargs), e.g. self.client.get,
+        is at most 'milliseconds'.
+
+        func is called 'warmup' (default 5) times unmeasured, then 'runs' (default 100) times,
+        or for 'duration' seconds. Any server error response fails the assertion.
+        Returns LatencyStats of the calls.
+        """
+        options = self._performance_options(kwargs, percentile = 95)
+        stats, seconds = self._measure(func, args, kwargs, options)
+        measured = stats.percentile(options['percentile'])
+
+        self.assertLessEqual(measured, milliseconds, "p{0} response time {1:.2f}ms, maximum {2}ms expected\n    {3}".format(
+            options['percentile'], measured, milliseconds, stats))
+        self._compare_baseline(options['name'], dict(('p{0}'.format(percent), stats.percentile(percent)) for percent in LatencyStats.PERCENTILES), stats)
+
+        return stats
+
+    def assertThroughput(self, per_second, func, *args, **kwargs):
+        """ assert func(*args, **kwargs) is called at least 'per_second' times per second, sequentially.
+
+        Takes same 'warmup', 'runs' and 'duration' options as assertResponseTime.
+        Returns LatencyStats of the calls.
+        """
+        options = self._performance_options(kwargs)
+        stats, seconds = self._measure(func, args, kwargs, options)
+        throughput = stats.count / seconds if seconds else float('inf')
+
+        self.assertGreaterEqual(throughput, per_second, "throughput {0:.1f}/s, minimum {1}/s expected\n    {2}".format(throughput, per_second, stats))
+        self._compare_baseline(options['name'], {'throughput': throughput}, stats, higher_is_better = True)
+
+        return stats
+
+    def _performance_options(self, kwargs, **defaults):
+        options = dict(defaults, runs = 100, warmup = 5, duration = None, name = None)
+
+        for option in list(options):
+            if option in kwargs:
+                options[option] = kwargs.pop(option)
+
+        if options['name'] is None:
+            # several measurements in one test get their own baseline entry
+            self._performance_counter = getattr(self, '_performance_counter', 0) + 1
+            options['name'] = self.id() if self._performance_counter == 1 else '{0}.{1}'.format(self.id(), self._performance_counter)
+
+        return options
+
+    def _measure(self, func, args, kwargs, options):
+        def call():
+            response = func(*args, **kwargs)
+
+            if getattr(response, 'status_code', 200) >= 500:
+                self.fail("server error {0} while measuring performance".format(response.status_code))
+
+        samples, seconds = sample(call, options['runs'], options['warmup'], options['duration'])
+
+        return LatencyStats(samples), seconds
+
+    def _compare_baseline(self, name, metrics, stats, higher_is_better = False):
+        if not self.PERFORMANCE_BASELINE_FILE:
+            return
+
+        regressions = Baseline(self.PERFORMANCE_BASELINE_FILE, self.PERFORMANCE_TOLERANCE).compare(name, metrics, higher_is_better)
+
+        if regressions:
+            self.fail("performance regressed against {0}:\n    {1}\n    {2}".format(self.PERFORMANCE_BASELINE_FILE, '\n    '.join(regressions), stats))
+
+
+class _AssertQueryBudget(object):
+
+    """ Context Manager capturing queries of every backend of test case and asserting a budget for each.
+
+    Context returns itself, having (milliseconds, description) of captured queries
+    (redis: round trips) per backend in 'captured', number of queries (redis: commands)
+    in 'counts' and wall clock time of context in 'duration' (ms). Backends test case
+    does not use have None in both.
+    """
+
+    BACKENDS = ('sql', 'mongo', 'redis', 'cypher')
+
+    def __init__(self, test_case, sql = None, mongo = None, redis = None, cypher = None, total_ms = None):
+        self.test_case = test_case
+        self.budgets = {'sql': sql, 'mongo': mongo, 'redis': redis, 'cypher': cypher}
+        self.total_ms = total_ms
+        self.captured = {}
+        self.counts = {}
+        self.duration = None
+        self._contexts = []
+
+    def _sql_contexts(self):
+        from django.db import connections
+        from django.test.utils import CaptureQueriesContext
+
+        databases = getattr(self.test_case, 'databases', None) or ()
+        aliases = list(connections) if databases == '__all__' else sorted(databases)
+
+        return [CaptureQueriesContext(connections[alias]) for alias in aliases]
+
+    def __enter__(self):
+        self._contexts = [('sql', context) for context in self._sql_contexts()]
+
+        if isinstance(self.test_case, MongoTestMixin):
+            self._contexts.append(('mongo', _CaptureQueries(self.test_case)))
+
+        if isinstance(self.test_case, RedisTestMixin):
+            self._contexts.append(('redis', _CaptureRedisCommands(self.test_case, None)))
+
+        if isinstance(self.test_case, Neo4jTestMixin):
+            self._contexts.append(('cypher', _CaptureCypherQueries(self.test_case, None)))
+
+        self.captured = dict((backend, None) for backend in self.BACKENDS)
+        self.counts = dict((backend, None) for backend in self.BACKENDS)
+
+        for backend, context in self._contexts:
+            context.__enter__()
+            self.captured[backend] = self.captured[backend] or []
+            self.counts[backend] = self.counts[backend] or 0
+
+        self._started = _timer()
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.duration = (_timer() - self._started) * 1000.0
+
+        for backend, context in reversed(self._contexts):
+            context.__exit__(type, value, traceback)
+            queries = self._queries(backend, context)
+            self.captured[backend].extend(queries)
+            self.counts[backend] += sum(len(round_trip.commands) for round_trip in context.round_trips) if backend == 'redis' else len(queries)
+
+        if type is None:
+            self._assert()
+
+    def _queries(self, backend, context):
+        """ (_AssertQueryBudget, str, object) -> (list)
+        return (milliseconds, description) of every query captured by 'context'.
+        """
+        if backend == 'sql':
+            return [(float(query['time']) * 1000.0, '{0}: {1}'.format(context.connection.alias, query['sql'])) for query in context.captured_queries]
+
+        if backend == 'redis':
+            return [(round_trip.duration or 0.0, ' | '.join(' '.join(str(arg) for arg in args[:2]) for args in round_trip.commands)) for round_trip in context.round_trips]
+
+        # mongo CapturedCommand and CypherQuery
+        return [(query.duration or 0.0, str(query)) for query in context.captured_queries]
+
+    def _exceeded(self):
+        exceeded = [backend for backend in self.BACKENDS if self.budgets[backend] is not None and (self.counts[backend] or 0) > self.budgets[backend]]
+
+        if self.total_ms is not None and self.duration > self.total_ms:
+            exceeded.append('total')
+
+        return exceeded
+
+    def _assert(self):
+        exceeded = self._exceeded()
+
+        if exceeded:
+            self.test_case.fail('query budget exceeded by {0}\n{1}'.format(', '.join(exceeded), self.breakdown()))
+
+    def breakdown(self):
+        """ (_AssertQueryBudget) -> (str)
+        return per backend number of queries and time taken, against budget, followed by the queries.
+        """
+        exceeded = self._exceeded()
+        lines = []
+
+        for backend in self.BACKENDS:
+            queries = self.captured.get(backend)
+
+            if queries is None:
+                lines.append('    {0:<7} not used by test case'.format(backend))
+                continue
+
+            budget = '-' if self.budgets[backend] is None else self.budgets[backend]
+            lines.append('    {0:<7} {1:>5} (budget {2}) {3:9.2f}ms{4}'.format(
+                backend, self.counts[backend], budget, sum(duration for duration, _ in queries), '  EXCEEDED' if backend in exceeded else ''))
+
+        lines.append('    {0:<7} {1:>5} (budget {2}) {3:9.2f}ms{4}'.format(
+            'total', '', '-' if self.total_ms is None else '{0}ms'.format(self.total_ms), self.duration, '  EXCEEDED' if 'total' in exceeded else ''))
+
+        for backend in self.BACKENDS:
+            for number, (duration, description) in enumerate(self.captured.get(backend) or [], 1):
+                lines.append('    {0} {1}. {2:.2f}ms {3}'.format(backend, number, duration, description))
+
+        return '\n'.join(lines)
+
+
+class LoadTestMixin(object):
+
+    """ Mixin for live server test cases to drive the live server from concurrent HTTP clients
+
+    Clients are LOAD_CONCURRENCY threads by default, or coroutines of an asyncio event
+    loop with LOAD_MODE = 'asyncio'. Mixed with MongoTestMixin, mongo commands the
+    server sends to test database during load are counted too.
+    """
+
+    LOAD_CONCURRENCY = 10
+    LOAD_MODE = THREADS
+    LOAD_TIMEOUT = 30
+
+    def generate_load(self, path, method = 'GET', data = None, headers = None, requests = None, duration = None, concurrency = None, mode = None):
+        """ (LoadTestMixin, str, str, dict or bytes, dict, int, float, int, str) -> (LoadReport)
+        send 'method' requests to 'path' of live server, 'requests' in total or for 'duration' seconds,
+        return report of throughput, latency percentiles, errors and mongo commands.
+
+        dict 'data' is sent form encoded, bytes as they are, with Content-Type of 'headers'.
+        """
+        generator = LoadGenerator(self.live_server_url, concurrency or self.LOAD_CONCURRENCY, mode or self.LOAD_MODE, self.LOAD_TIMEOUT)
+        mongo_database = self.MONGO_DB_SETTINGS['db'] if isinstance(self, MongoTestMixin) else None
+
+        with timing_report.phase(self, 'load'):
+            return generator.run(path, method, data, headers, requests, duration, mongo_database)
+
+    def assertLoad(self, report, max_error_rate = 0.0, min_throughput = None, max_latency_ms = None, percentile = 95, max_mongo_commands_per_request = None):
+        """ assert LoadReport 'report' (see generate_load) is within limits, None meaning no limit.
+
+        'max_latency_ms' limits 'percentile' of request latencies.
+        """
+        failures = []
+
+        if report.error_rate > max_error_rate:
+            failures.append('error rate {0:.2%}, maximum {1:.2%} expected'.format(report.error_rate, max_error_rate))
+
+        if min_throughput is not None and report.throughput < min_throughput:
+            failures.append('throughput {0:.1f}/s, minimum {1}/s expected'.format(report.throughput, min_throughput))
+
+        latency = report.latency.percentile(percentile)
+
+        if max_latency_ms is not None and latency > max_latency_ms:
+            failures.append('p{0} latency {1:.2f}ms, maximum {2}ms expected'.format(percentile, latency, max_latency_ms))
+
+        if max_mongo_commands_per_request is not None and report.mongo_commands_per_request > max_mongo_commands_per_request:
+            failures.append('{0:.1f} mongo commands per request, maximum {1} expected'.format(report.mongo_commands_per_request, max_mongo_commands_per_request))
+
+        if failures:
+            self.fail('load {0}\n{1}'.format(', '.join(failures), report))
@@ -0,0 +1,810 @@
+# inbuild python imports
+import contextlib
+import re
+import threading
+import time
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+
+
+class CommandSubscriber(object):
+
+    """ Base class for objects receiving mongo command events from MongoCommandListener """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class MongoCommandListener(object):
+
+    """ Command listener, registered once per pymongo client, dispatching events to subscribers.
+
+    Subscribers are added and removed at runtime, so a client never needs to be
+    recreated to start or stop recording commands. pymongo only accepts instances
+    of its CommandListener, pass pymongo_listener() to clients.
+    """
+
+    def __init__(self):
+        self._subscribers = ()
+        self._lock = threading.Lock()
+        self._pymongo_listener = None
+
+    def pymongo_listener(self):
+        """ (MongoCommandListener) -> (pymongo.monitoring.CommandListener)
+        return pymongo listener forwarding events to this one, pymongo is imported only here.
+        """
+        if self._pymongo_listener is None:
+            from pymongo import monitoring
+
+            listener = self
+
+            class PymongoCommandListener(monitoring.CommandListener):
+
+                def started(self, event):
+                    listener.started(event)
+
+                def succeeded(self, event):
+                    listener.succeeded(event)
+
+                def failed(self, event):
+                    listener.failed(event)
+
+            self._pymongo_listener = PymongoCommandListener()
+
+        return self._pymongo_listener
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                self._subscribers = self._subscribers + (subscriber, )
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = tuple(item for item in self._subscribers if item is not subscriber)
+
+    def started(self, event):
+        for subscriber in self._subscribers:
+            subscriber.started(event)
+
+    def succeeded(self, event):
+        for subscriber in self._subscribers:
+            subscriber.succeeded(event)
+
+    def failed(self, event):
+        for subscriber in self._subscribers:
+            subscriber.failed(event)
+
+
+command_listener = MongoCommandListener()
+
+
+IGNORED_COMMANDS = frozenset([
+    'hello', 'ismaster', 'isMaster', 'ping', 'buildinfo', 'buildInfo', 'getnonce', 'authenticate',
+    'saslStart', 'saslContinue', 'endSessions', 'killCursors', 'createIndexes', 'listIndexes',
+])
+
+
+class QueryRecorder(CommandSubscriber):
+
+    """ Forward command events to recording contexts active in the thread issuing the command.
+
+    Contexts are kept per thread, so tests running in other threads, or other
+    processes sharing the same mongod, never affect each other's counts.
+    Handshake and index maintenance commands (IGNORED_COMMANDS) are not forwarded.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _contexts(self):
+        contexts = getattr(self._local, 'contexts', None)
+
+        if contexts is None:
+            contexts = self._local.contexts = []
+
+        return contexts
+
+    def push(self, context):
+        self._contexts().append(context)
+
+    def pop(self, context):
+        contexts = self._contexts()
+
+        if context in contexts:
+            contexts.remove(context)
+
+    @contextlib.contextmanager
+    def suspended(self):
+        """ (QueryRecorder) -> (NoneType)
+        context manager not forwarding commands issued inside it, e.g. test utilities' own queries.
+        """
+        contexts = self._contexts()
+        self._local.contexts = []
+
+        try:
+            yield
+        finally:
+            self._local.contexts = contexts
+
+    def _forward(self, method_name, event):
+        contexts = getattr(self._local, 'contexts', None)
+
+        if not contexts:
+            return
+
+        for context in list(contexts):
+            getattr(context, method_name)(event)
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self._forward('started', event)
+
+    def succeeded(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self._forward('succeeded', event)
+
+    def failed(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self._forward('failed', event)
+
+
+query_recorder = QueryRecorder()
+command_listener.subscribe(query_recorder)
+
+
+FILTER_FIELDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+    'findandmodify': 'query',
+}
+
+
+def filter_shape(value):
+    """ (object) -> (object)
+    return shape of mongo filter, with literal values replaced by '?'.
+
+    >>> filter_shape({'age': {'$gt': 21}, '$or': [{'name': 'x'}, {'tags': {'$in': [1, 2]}}]})
+    {'age': {'$gt': '?'}, '$or': [{'name': '?'}, {'tags': {'$in': '?'}}]}
+    """
+    if isinstance(value, dict):
+        return dict((key, filter_shape(item)) for key, item in value.items())
+
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [filter_shape(item) for item in value]
+
+    return '?'
+
+
+def command_filter(command_name, command):
+    """ (str, dict) -> (dict or NoneType)
+    return filter used by mongo command, if any.
+    """
+    if command_name in FILTER_FIELDS:
+        return command.get(FILTER_FIELDS[command_name])
+
+    if command_name in ('update', 'delete'):
+        statements = command.get(command_name + 's') or [{}]
+        return statements[0].get('q')
+
+    if command_name == 'aggregate':
+        for stage in command.get('pipeline', [])[:1]:
+            return stage.get('$match')
+
+
+_string_types = (type(''), type(u''))
+
+
+def _bson_size(document):
+    try:
+        from bson import BSON
+    except ImportError:
+        return None
+
+    return len(BSON.encode(document))
+
+
+class CapturedCommand(object):
+
+    """ Details of single mongo command captured during a test """
+
+    EXPLAINABLE_COMMANDS = frozenset(['find', 'aggregate', 'count', 'distinct', 'findAndModify', 'findandmodify', 'update', 'delete'])
+
+    def __init__(self, event):
+        self.database = event.database_name
+        self.operation = event.command_name
+        self.command = dict(event.command)
+        self.collection = self.command.get(self.operation) if isinstance(self.command.get(self.operation), _string_types) else None
+        raw_filter = command_filter(self.operation, self.command)
+        self.filter = filter_shape(raw_filter) if raw_filter is not None else None
+        self.request_bytes = _bson_size(event.command)
+        self.duration = None
+        self.documents_returned = None
+        self.reply_bytes = None
+        self.failure = None
+
+    @property
+    def explainable(self):
+        return self.operation in self.EXPLAINABLE_COMMANDS
+
+    def succeeded(self, event):
+        self.duration = event.duration_micros / 1000.0
+        self.reply_bytes = _bson_size(event.reply)
+        self.documents_returned = self._documents_returned(event.reply)
+
+    def failed(self, event):
+        self.duration = event.duration_micros / 1000.0
+        self.failure = event.failure
+
+    def _documents_returned(self, reply):
+        if 'cursor' in reply:
+            cursor = reply['cursor']
+            return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+
+        if 'values' in reply:
+            return len(reply['values'])
+
+        if 'value' in reply:
+            return 1 if reply['value'] else 0
+
+        return reply.get('n')
+
+    def __str__(self):
+        return '{0} {1} filter={2} {3}ms documents={4} bytes={5}/{6}{7}'.format(
+            self.operation, self.collection, self.filter,
+            '?' if self.duration is None else '{0:.2f}'.format(self.duration),
+            self.documents_returned, self.request_bytes, self.reply_bytes,
+            ' failed: {0}'.format(self.failure) if self.failure else '')
+
+    __repr__ = __str__
+
+
+SESSION_FIELDS = frozenset(['lsid', '$db', '$clusterTime', 'txnNumber', 'autocommit', 'startTransaction', '$readPreference', 'readConcern', 'writeConcern'])
+
+
+def explain(db, captured_command, verbosity = 'queryPlanner'):
+    """ (Database, CapturedCommand, str) -> (dict)
+    run explain for captured command and return server's response.
+    """
+    from bson.son import SON
+
+    command = SON((key, value) for key, value in captured_command.command.items() if key not in SESSION_FIELDS)
+
+    with query_recorder.suspended():
+        return db.command(SON([('explain', command), ('verbosity', verbosity)]))
+
+
+def plan_stages(explain_output):
+    """ (dict) -> (list)
+    return list of (stage, index_name) for every plan stage found in explain output.
+    """
+    stages = []
+
+    if isinstance(explain_output, dict):
+        if 'stage' in explain_output:
+            stages.append((explain_output['stage'], explain_output.get('indexName')))
+
+        for key, value in explain_output.items():
+            if key not in ('rejectedPlans', 'allPlansExecution'):
+                stages.extend(plan_stages(value))
+
+    elif isinstance(explain_output, (list, tuple)):
+        for value in explain_output:
+            stages.extend(plan_stages(value))
+
+    return stages
+
+
+def execution_time(explain_output):
+    """ (dict) -> (int)
+    return server side execution time, in milliseconds, from 'executionStats' explain output.
+    """
+    if isinstance(explain_output, dict):
+        if 'executionTimeMillis' in explain_output:
+            return explain_output['executionTimeMillis']
+
+        values = explain_output.values()
+    elif isinstance(explain_output, (list, tuple)):
+        values = explain_output
+    else:
+        return 0
+
+    return max([execution_time(value) for value in values] or [0])
+
+
+REDIS_IGNORED_COMMANDS = frozenset(['AUTH', 'HELLO', 'SELECT', 'CLIENT', 'PING', 'READONLY', 'ECHO', 'MULTI', 'EXEC'])
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+def redis_command_name(args):
+    """ (tuple) -> (str)
+    return upper cased name of redis command from its arguments, e.g. ('set', 'key', 1) -> 'SET'.
+    """
+    name = args[0]
+
+    if isinstance(name, bytes) and not isinstance(name, str):
+        name = name.decode('utf-8')
+
+    return name.split()[0].upper()
+
+
+def redis_key(key):
+    """ (object) -> (bytes)
+    return redis key as bytes, the way redis client encodes it.
+    """
+    if isinstance(key, (bytes, bytearray)):
+        return bytes(key)
+
+    return (key if isinstance(key, _string_types) else str(key)).encode('utf-8')
+
+
+def redis_args_size(args):
+    """ (tuple) -> (int)
+    return approximate size in bytes of redis command arguments.
+    """
+    return sum(len(arg) if isinstance(arg, (bytes, bytearray, memoryview)) else len(str(arg).encode('utf-8')) for arg in args)
+
+
+class RedisRoundTrip(object):
+
+    """ Commands sent to redis in single round trip, i.e. single command or whole pipeline """
+
+    def __init__(self, pool, commands):
+        self.pool = pool
+        self.commands = commands
+        self.started = _timer()
+        self.finished = None
+
+    @property
+    def duration(self):
+        """ milliseconds between sending commands and reading last response read so far """
+        return None if self.finished is None else (self.finished - self.started) * 1000.0
+
+    @property
+    def size(self):
+        return sum(redis_args_size(args) for args in self.commands)
+
+
+class RedisSubscriber(object):
+
+    """ Base class for objects receiving round trips from RedisCommandListener """
+
+    def redis_round_trip(self, round_trip):
+        pass
+
+
+class RedisCommandListener(object):
+
+    """ Instrument redis connection pools and dispatch commands sent through them to subscribers.
+
+    Every connection handed out by an instrumented pool reports single commands
+    and whole pipelines as RedisRoundTrip, so one dispatch corresponds to one
+    round trip.
+    """
+
+    def __init__(self):
+        self._subscribers = ()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                self._subscribers = self._subscribers + (subscriber, )
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = tuple(item for item in self._subscribers if item is not subscriber)
+
+    def instrument(self, client):
+        """ (RedisCommandListener, Redis) -> (NoneType)
+        instrument connection pool of redis client, if not instrumented already.
+        """
+        pool = client.connection_pool
+
+        with self._lock:
+            if getattr(pool, '_test_addons_listener', None) is self:
+                return
+
+            get_connection = pool.get_connection
+
+            def instrumented_get_connection(*args, **kwargs):
+                connection = get_connection(*args, **kwargs)
+
+                if getattr(connection, '_test_addons_listener', None) is not self:
+                    self._instrument_connection(pool, connection)
+
+                return connection
+
+            pool.get_connection = instrumented_get_connection
+            pool._test_addons_listener = self
+
+    def _instrument_connection(self, pool, connection):
+        send_command = connection.send_command
+        pack_commands = connection.pack_commands
+        read_response = connection.read_response
+
+        def instrumented_send_command(*args, **kwargs):
+            self._dispatch(pool, connection, [args])
+            return send_command(*args, **kwargs)
+
+        def instrumented_pack_commands(commands):
+            commands = list(commands)
+            self._dispatch(pool, connection, commands)
+            return pack_commands(commands)
+
+        def instrumented_read_response(*args, **kwargs):
+            try:
+                return read_response(*args, **kwargs)
+            finally:
+                round_trip = connection._test_addons_round_trip
+
+                if round_trip is not None:
+                    round_trip.finished = _timer()
+
+        connection.send_command = instrumented_send_command
+        connection.pack_commands = instrumented_pack_commands
+        connection.read_response = instrumented_read_response
+        connection._test_addons_round_trip = None
+        connection._test_addons_listener = self
+
+    def _dispatch(self, pool, connection, commands):
+        if not self._subscribers or getattr(self._local, 'suspended', False):
+            connection._test_addons_round_trip = None
+            return
+
+        commands = [args for args in commands if redis_command_name(args) not in REDIS_IGNORED_COMMANDS]
+
+        if not commands:
+            # responses to ignored commands must not extend previous round trip
+            connection._test_addons_round_trip = None
+            return
+
+        round_trip = connection._test_addons_round_trip = RedisRoundTrip(pool, commands)
+
+        for subscriber in self._subscribers:
+            subscriber.redis_round_trip(round_trip)
+
+    @contextlib.contextmanager
+    def suspended(self):
+        """ (RedisCommandListener) -> (NoneType)
+        context manager not dispatching commands sent from current thread inside it.
+        """
+        suspended = getattr(self._local, 'suspended', False)
+        self._local.suspended = True
+
+        try:
+            yield
+        finally:
+            self._local.suspended = suspended
+
+
+redis_listener = RedisCommandListener()
+
+
+class RedisQueryRecorder(QueryRecorder, RedisSubscriber):
+
+    """ Forward redis round trips to recording contexts active in the thread sending them """
+
+    def redis_round_trip(self, round_trip):
+        self._forward('redis_round_trip', round_trip)
+
+
+redis_recorder = RedisQueryRecorder()
+redis_listener.subscribe(redis_recorder)
+
+
+CYPHER_WRITE_CLAUSES = re.compile(r'\b(CREATE|MERGE|SET|DELETE|REMOVE|FOREACH|LOAD\s+CSV)\b', re.IGNORECASE)
+GRAPH_WRITE_METHODS = frozenset(['create_unique', 'merge', 'merge_one', 'push', 'delete', 'delete_all'])
+CYPHER_STATEMENT_METHODS = frozenset(['execute', 'execute_one', 'run', 'stream', 'post'])
+
+
+def is_cypher_write(statement):
+    """ (str) -> (bool)
+    return True if cypher statement contains clause, which might write to graph.
+    """
+    return bool(CYPHER_WRITE_CLAUSES.search(statement))
+
+
+class CypherQuery(object):
+
+    """ Single cypher statement executed during a test """
+
+    def __init__(self, statement, parameters):
+        self.statement = statement
+        self.parameters = parameters
+        self.duration = None
+        self.rows = None
+        self.failure = None
+        self.plan = None
+
+    def __str__(self):
+        return '{0} parameters={1} {2}ms rows={3}{4}'.format(
+            ' '.join(self.statement.split()), self.parameters,
+            '?' if self.duration is None else '{0:.2f}'.format(self.duration),
+            self.rows, ' failed: {0!r}'.format(self.failure) if self.failure else '')
+
+    __repr__ = __str__
+
+
+def _num_of_rows(result):
+    if result is None:
+        return 0
+
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+class GraphSubscriber(object):
+
+    """ Base class for objects receiving events from InstrumentedGraph """
+
+    def cypher_statement(self, statement, parameters):
+        """ called before statement is sent """
+        pass
+
+    def cypher_executed(self, query):
+        """ called with CypherQuery once statement is executed, or queued into transaction """
+        pass
+
+    def graph_entities_creating(self, entities):
+        """ called with entities passed to Graph.create, before they are created """
+        pass
+
+    def graph_entities_created(self, entities):
+        pass
+
+    def graph_write(self, method_name):
+        pass
+
+
+class GraphListener(object):
+
+    """ Instrument py2neo classes and dispatch writes made through any of their instances to subscribers.
+
+    Unlike InstrumentedGraph, which only sees what goes through a test's graph_db,
+    writes application code makes through its own Graph are dispatched too. Cypher
+    statements are dispatched by cypher_statement before they are sent, nested
+    calls (e.g. statement Graph.create sends) are not dispatched again.
+    """
+
+    def __init__(self):
+        self._subscribers = ()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                self._subscribers = self._subscribers + (subscriber, )
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = tuple(item for item in self._subscribers if item is not subscriber)
+
+    def instrument(self, graph):
+        """ (GraphListener, Graph) -> (NoneType)
+        instrument class of 'graph' and of its cypher resource, if not instrumented already.
+        Classes of transactions are instrumented once the first one is begun.
+        """
+        with self._lock:
+            self._instrument_method(type(graph), 'create', self._create_method)
+
+            for name in GRAPH_WRITE_METHODS:
+                self._instrument_method(type(graph), name, self._write_method)
+
+            for name in CYPHER_STATEMENT_METHODS:
+                self._instrument_method(type(graph.cypher), name, self._statement_method)
+
+            self._instrument_method(type(graph.cypher), 'begin', self._begin_method)
+
+    def _instrument_method(self, cls, name, instrumented):
+        method = getattr(cls, name, None)
+
+        if method is None or getattr(method, '_test_addons_listener', None) is self:
+            return
+
+        instrumented_method = instrumented(name, method)
+        instrumented_method._test_addons_listener = self
+        setattr(cls, name, instrumented_method)
+
+    @contextlib.contextmanager
+    def _dispatching(self):
+        """ yield True if call should be dispatched, i.e. there are subscribers and it is not nested in one that was """
+        if not self._subscribers or getattr(self._local, 'dispatching', False):
+            yield False
+            return
+
+        self._local.dispatching = True
+
+        try:
+            yield True
+        finally:
+            self._local.dispatching = False
+
+    def _create_method(self, name, method):
+        def instrumented_method(graph, *entities):
+            with self._dispatching() as dispatch:
+                if not dispatch:
+                    return method(graph, *entities)
+
+                for subscriber in self._subscribers:
+                    subscriber.graph_entities_creating(entities)
+
+                created = method(graph, *entities)
+
+                for subscriber in self._subscribers:
+                    subscriber.graph_entities_created(created)
+
+                return created
+
+        return instrumented_method
+
+    def _write_method(self, name, method):
+        def instrumented_method(graph, *args, **kwargs):
+            with self._dispatching() as dispatch:
+                if dispatch:
+                    for subscriber in self._subscribers:
+                        subscriber.graph_write(name)
+
+                return method(graph, *args, **kwargs)
+
+        return instrumented_method
+
+    def _statement_method(self, name, method):
+        def instrumented_method(resource, statement, parameters = None, **kwparameters):
+            with self._dispatching() as dispatch:
+                if dispatch:
+                    for subscriber in self._subscribers:
+                        subscriber.cypher_statement(statement, dict(parameters or {}, **kwparameters))
+
+                return method(resource, statement, parameters, **kwparameters)
+
+        return instrumented_method
+
+    def _begin_method(self, name, method):
+        def instrumented_method(resource, *args, **kwargs):
+            transaction = method(resource, *args, **kwargs)
+
+            with self._lock:
+                self._instrument_method(type(transaction), 'append', self._statement_method)
+
+            return transaction
+
+        return instrumented_method
+
+
+graph_listener = GraphListener()
+
+
+class InstrumentedGraph(object):
+
+    """ Proxy to py2neo Graph reporting cypher statements, created entities and writes to subscribers """
+
+    def __init__(self, graph, subscribers = ()):
+        self.__dict__['graph'] = graph
+        self.__dict__['subscribers'] = list(subscribers)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.graph, name)
+
+        if name in GRAPH_WRITE_METHODS and callable(attribute):
+            return self._write_method(name, attribute)
+
+        return attribute
+
+    def __setattr__(self, name, value):
+        setattr(self.graph, name, value)
+
+    def _write_method(self, name, method):
+        def instrumented_method(*args, **kwargs):
+            for subscriber in list(self.subscribers):
+                subscriber.graph_write(name)
+
+            return method(*args, **kwargs)
+
+        return instrumented_method
+
+    @property
+    def cypher(self):
+        return _InstrumentedCypher(self.graph.cypher, self)
+
+    def create(self, *entities):
+        for subscriber in list(self.subscribers):
+            subscriber.graph_entities_creating(entities)
+
+        created = self.graph.create(*entities)
+
+        for subscriber in list(self.subscribers):
+            subscriber.graph_entities_created(created)
+
+        return created
+
+    def _execute(self, method, statement, parameters, kwparameters, queued = False):
+        query = CypherQuery(statement, dict(parameters or {}, **kwparameters))
+
+        for subscriber in list(self.subscribers):
+            subscriber.cypher_statement(statement, query.parameters)
+
+        started = _timer()
+
+        try:
+            result = method(statement, parameters, **kwparameters)
+        except Exception as exc:
+            query.failure = exc
+            raise
+        else:
+            query.rows = None if queued else _num_of_rows(result)
+            return result
+        finally:
+            query.duration = None if queued else (_timer() - started) * 1000.0
+
+            for subscriber in list(self.subscribers):
+                subscriber.cypher_executed(query)
+
+
+class _InstrumentedCypher(object):
+
+    def __init__(self, cypher, instrumented_graph):
+        self._cypher = cypher
+        self._instrumented_graph = instrumented_graph
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cypher, name)
+
+        if name in CYPHER_STATEMENT_METHODS and callable(attribute):
+            return self._statement_method(attribute)
+
+        return attribute
+
+    def _statement_method(self, method):
+        def instrumented_method(statement, parameters = None, **kwparameters):
+            return self._instrumented_graph._execute(method, statement, parameters, kwparameters)
+
+        return instrumented_method
+
+    def begin(self, *args, **kwargs):
+        return _InstrumentedTransaction(self._cypher.begin(*args, **kwargs), self._instrumented_graph)
+
+
+class _InstrumentedTransaction(object):
+
+    def __init__(self, transaction, instrumented_graph):
+        self._transaction = transaction
+        self._instrumented_graph = instrumented_graph
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+    def append(self, statement, parameters = None, **kwparameters):
+        return self._instrumented_graph._execute(self._transaction.append, statement, parameters, kwparameters, queued = True)
+
+
+def cypher_plan(graph, query):
+    """ (Graph, CypherQuery) -> (dict or NoneType)
+    return execution plan of captured query, as returned by neo4j.
+
+    Read only statements are run again with PROFILE, statements which might
+    write to graph are only prefixed with EXPLAIN, so they are not executed twice.
+    """
+    prefix = 'EXPLAIN' if is_cypher_write(query.statement) else 'PROFILE'
+    response = graph.cypher.post('{0} {1}'.format(prefix, query.statement), query.parameters)
+    content = getattr(response, 'content', None) or {}
+
+    return content.get('plan') if isinstance(content, dict) else None
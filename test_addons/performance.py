@@ -0,0 +1,193 @@
+# inbuild python imports
+import json
+import os
+import threading
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .monitoring import _timer
+
+
+# set to '1' to write measured values into baseline files instead of comparing with them
+UPDATE_BASELINE_ENVIRON = 'TEST_ADDONS_UPDATE_BASELINE'
+
+
+def percentile(sorted_values, percent):
+    """ (list, float) -> (float)
+    return 'percent' percentile of 'sorted_values', interpolating between closest ranks.
+
+    >>> percentile([10, 20, 30, 40], 50)
+    25.0
+    """
+    if not sorted_values:
+        return 0.0
+
+    rank = (len(sorted_values) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+class LatencyStats(object):
+
+    """ Percentiles and mean of latency samples, in milliseconds """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, samples):
+        self.samples = sorted(samples)
+
+    @property
+    def count(self):
+        return len(self.samples)
+
+    @property
+    def mean(self):
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+    @property
+    def min(self):
+        return self.samples[0] if self.samples else 0.0
+
+    @property
+    def max(self):
+        return self.samples[-1] if self.samples else 0.0
+
+    def percentile(self, percent):
+        return percentile(self.samples, percent)
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p95(self):
+        return self.percentile(95)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    def as_dict(self):
+        return dict([('count', self.count), ('mean', self.mean), ('min', self.min), ('max', self.max)] + [('p{0}'.format(percent), self.percentile(percent)) for percent in self.PERCENTILES])
+
+    def __str__(self):
+        return '{0} samples, mean {1:.2f}ms, min {2:.2f}ms, p50 {3:.2f}ms, p95 {4:.2f}ms, p99 {5:.2f}ms, max {6:.2f}ms'.format(
+            self.count, self.mean, self.min, self.p50, self.p95, self.p99, self.max)
+
+    __repr__ = __str__
+
+
+def sample(func, runs = 100, warmup = 5, duration = None):
+    """ (callable, int, int, float) -> (list, float)
+    call 'func' 'warmup' times unmeasured, then 'runs' times (or for 'duration' seconds, if given),
+    return (milliseconds taken by each call, seconds taken by all of them).
+    """
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    started = _timer()
+
+    while (len(samples) < runs) if duration is None else (_timer() - started < duration):
+        call_started = _timer()
+        func()
+        samples.append((_timer() - call_started) * 1000.0)
+
+    return samples, _timer() - started
+
+
+class Baseline(object):
+
+    """ JSON file, kept in the repository, with performance measured earlier per test and metric.
+
+    Measured values are compared with stored ones, allowing 'tolerance' (fraction)
+    of regression. With TEST_ADDONS_UPDATE_BASELINE=1 in environment they are
+    written to the file instead.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path, tolerance = 0.2):
+        self.path = path
+        self.tolerance = tolerance
+
+    @property
+    def updating(self):
+        return os.environ.get(UPDATE_BASELINE_ENVIRON) == '1'
+
+    def _load(self):
+        try:
+            with open(self.path) as baseline_file:
+                return json.load(baseline_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def compare(self, name, metrics, higher_is_better = False):
+        """ (Baseline, str, dict, bool) -> (list)
+        return descriptions of 'metrics' regressed against baseline of 'name', or store them if updating.
+        """
+        if self.updating:
+            self.update(name, metrics)
+            return []
+
+        stored = self._load().get(name, {})
+        regressions = []
+
+        for metric, value in sorted(metrics.items()):
+            if metric not in stored:
+                continue
+
+            if higher_is_better:
+                limit = stored[metric] * (1 - self.tolerance)
+                regressed = value < limit
+            else:
+                limit = stored[metric] * (1 + self.tolerance)
+                regressed = value > limit
+
+            if regressed:
+                regressions.append('{0} {1:.3f}, baseline {2:.3f} (limit {3:.3f})'.format(metric, value, stored[metric], limit))
+
+        return regressions
+
+    def update(self, name, metrics):
+        with self._lock:
+            baseline = self._load()
+            baseline[name] = dict(baseline.get(name, {}), **metrics)
+
+            with open(self.path, 'w') as baseline_file:
+                json.dump(baseline, baseline_file, indent = 2, sort_keys = True)
+
+
+class TimedClientMixin(object):
+
+    """ Test client mixin timing every request, time is set as 'elapsed_ms' on response """
+
+    def request(self, **request):
+        started = _timer()
+        response = super(TimedClientMixin, self).request(**request)
+        response.elapsed_ms = (_timer() - started) * 1000.0
+
+        return response
+
+
+_timed_client_classes = {}
+
+
+def timed_client_class(client_class):
+    """ (type) -> (type)
+    return subclass of test 'client_class' timing its requests, see TimedClientMixin.
+    """
+    if issubclass(client_class, TimedClientMixin):
+        return client_class
+
+    if client_class not in _timed_client_classes:
+        _timed_client_classes[client_class] = type('Timed' + client_class.__name__, (TimedClientMixin, client_class), {})
+
+    return _timed_client_classes[client_class]
@@ -0,0 +1,89 @@
+# inbuild python imports
+import unittest
+
+# inbuilt django imports
+from django.test.runner import DiscoverRunner
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .timing import timing_report
+
+
+class TimingResultMixin(object):
+
+    """ Test result mixin telling timing report when each test starts and stops """
+
+    def startTest(self, test):
+        timing_report.start_test(test)
+        super(TimingResultMixin, self).startTest(test)
+
+    def stopTest(self, test):
+        super(TimingResultMixin, self).stopTest(test)
+        timing_report.stop_test(test)
+
+
+class TimingTestRunner(DiscoverRunner):
+
+    """ Test runner timing backend setup and teardown of every test.
+
+    Slowest tests and classes are printed at the end of the run, full report is
+    written with --timing-json and --timing-junit. Set TEST_RUNNER to
+    'test_addons.runner.TimingTestRunner' to use it.
+
+    With --parallel tests run in worker processes, whose timings the main process
+    never sees, so no report is produced.
+    """
+
+    PARALLEL_MESSAGE = 'Timing report is not produced with --parallel, tests run in worker processes. Run tests serially to time them.'
+
+    def __init__(self, timing_json = None, timing_junit = None, timing_top = 10, **kwargs):
+        super(TimingTestRunner, self).__init__(**kwargs)
+
+        self.timing_json = timing_json
+        self.timing_junit = timing_junit
+        self.timing_top = timing_top
+        self.timing_parallel = False
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(TimingTestRunner, cls).add_arguments(parser)
+
+        parser.add_argument('--timing-json', dest = 'timing_json', help = 'Write per test backend timing report as JSON to this file.')
+        parser.add_argument('--timing-junit', dest = 'timing_junit', help = 'Write per test backend timing report as JUnit XML properties to this file.')
+        parser.add_argument('--timing-top', dest = 'timing_top', type = int, default = 10, help = 'Number of slowest tests and classes to print.')
+
+    def get_resultclass(self):
+        resultclass = super(TimingTestRunner, self).get_resultclass() or unittest.TextTestResult
+
+        return type('Timing' + resultclass.__name__, (TimingResultMixin, resultclass), {})
+
+    def run_suite(self, suite, **kwargs):
+        self.timing_parallel = isinstance(suite, getattr(self, 'parallel_test_suite', ()))
+
+        if self.timing_parallel:
+            return super(TimingTestRunner, self).run_suite(suite, **kwargs)
+
+        timing_report.enable()
+
+        try:
+            return super(TimingTestRunner, self).run_suite(suite, **kwargs)
+        finally:
+            timing_report.disable()
+
+    def suite_result(self, suite, result, **kwargs):
+        if self.timing_parallel:
+            print('\n' + self.PARALLEL_MESSAGE)
+            return super(TimingTestRunner, self).suite_result(suite, result, **kwargs)
+
+        print('\n' + timing_report.summary(self.timing_top))
+
+        if self.timing_json:
+            timing_report.to_json(self.timing_json)
+
+        if self.timing_junit:
+            timing_report.to_junit(self.timing_junit)
+
+        return super(TimingTestRunner, self).suite_result(suite, result, **kwargs)
@@ -0,0 +1,116 @@
+# inbuild python imports
+
+# inbuilt django imports
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_module
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+
+
+_engine = {}
+_memory_store_classes = {}
+
+
+def get_session_engine():
+    """ (NoneType) -> (module)
+    return module of SESSION_ENGINE, imported once until the setting changes.
+    """
+    engine = _engine.get(settings.SESSION_ENGINE)
+
+    if engine is None:
+        engine = import_module(settings.SESSION_ENGINE)
+        _engine.clear()
+        _engine[settings.SESSION_ENGINE] = engine
+
+    return engine
+
+
+def _reset_session_engine(setting, **kwargs):
+    if setting in ('SESSION_ENGINE', 'SESSION_SERIALIZER'):
+        _engine.clear()
+        _memory_store_classes.clear()
+
+
+setting_changed.connect(_reset_session_engine)
+
+
+def memory_session_store_class():
+    """ (NoneType) -> (type)
+    return SessionStore of SESSION_ENGINE keeping sessions in process memory,
+    written to the backend only by its 'persist' method.
+
+    Each store keeps its saved sessions to itself, so they are gone along with
+    the request (and test) using it, and never seen by other tests.
+    """
+    engine = get_session_engine()
+
+    if engine not in _memory_store_classes:
+        base = engine.SessionStore
+
+        def memory_sessions(self):
+            # session key -> session data, of sessions saved (e.g. before cycling key) by this store
+            return self.__dict__.setdefault('_memory_sessions', {})
+
+        def exists(self, session_key):
+            return session_key in memory_sessions(self)
+
+        def create(self):
+            self._session_key = self._get_new_session_key()
+            self.save(must_create = True)
+            self.modified = True
+
+        def save(self, must_create = False):
+            if self.session_key is None:
+                return self.create()
+
+            memory_sessions(self)[self.session_key] = dict(self._get_session(no_load = must_create))
+
+        def delete(self, session_key = None):
+            memory_sessions(self).pop(session_key or self.session_key, None)
+
+        def load(self):
+            data = memory_sessions(self).get(self.session_key)
+
+            if data is None:
+                self._session_key = None
+                return {}
+
+            return dict(data)
+
+        def persist(self):
+            """ (SessionStore) -> (str)
+            write session to SESSION_ENGINE's backend, return its session key.
+            """
+            # data of a stored session is in memory, load it before backend's save skips loading
+            self._get_session()
+
+            if self.session_key is None:
+                self._session_key = self._get_new_session_key()
+
+            try:
+                base.save(self, must_create = True)
+            except CreateError:
+                # already in the backend, e.g. persisted earlier
+                base.save(self)
+
+            return self.session_key
+
+        # same name as base, session data is signed with a salt made of class name
+        _memory_store_classes[engine] = type(base.__name__, (base, ), {
+            '__module__': __name__,
+            '__qualname__': getattr(base, '__qualname__', base.__name__),
+            'exists': exists,
+            'create': create,
+            'save': save,
+            'delete': delete,
+            'load': load,
+            'persist': persist,
+        })
+
+    return _memory_store_classes[engine]
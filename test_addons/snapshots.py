@@ -0,0 +1,197 @@
+# inbuild python imports
+from collections import defaultdict
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .monitoring import redis_key, redis_listener
+
+
+class MongoSnapshot(object):
+
+    """ Raw BSON documents and indexes of every collection in database, restored with insert_many """
+
+    def __init__(self, db):
+        self.db = db
+        self.collections = {}
+        self.indexes = {}
+
+    def take(self):
+        """ (MongoSnapshot) -> (MongoSnapshot)
+        snapshot every non system collection of database.
+        """
+        from bson.codec_options import CodecOptions
+        from bson.raw_bson import RawBSONDocument
+
+        codec_options = CodecOptions(document_class = RawBSONDocument)
+        list_collection_names = getattr(self.db, 'list_collection_names', None) or self.db.collection_names
+
+        for name in list_collection_names():
+            if not name.startswith('system.'):
+                self.collections[name] = list(self.db.get_collection(name, codec_options = codec_options).find())
+                self.indexes[name] = [dict(index) for index in self.db[name].list_indexes() if index['name'] != '_id_']
+
+        return self
+
+    def _index_models(self, name):
+        from pymongo import IndexModel
+
+        return [IndexModel(list(index['key'].items()), **dict((option, value) for option, value in index.items() if option not in ('key', 'v', 'ns')))
+            for index in self.indexes[name]]
+
+    def restore(self, collections = None, dropped = None):
+        """ (MongoSnapshot, list, list) -> (NoneType)
+        insert snapshot documents back into (emptied) 'collections', every collection if None.
+
+        Indexes of 'dropped' collections, every collection if None, are created first.
+        """
+        collections = sorted(self.collections if collections is None else collections)
+
+        for name in collections:
+            if self.indexes.get(name) and (dropped is None or name in dropped):
+                self.db[name].create_indexes(self._index_models(name))
+
+            if self.collections.get(name):
+                self.db[name].insert_many(self.collections[name], ordered = False)
+
+    def discard(self):
+        """ (MongoSnapshot) -> (NoneType)
+        empty every snapshot collection.
+        """
+        for name in sorted(self.collections):
+            self.db[name].delete_many({})
+
+
+class RedisSnapshot(object):
+
+    """ DUMP payloads of keys in redis databases, restored with pipelined RESTORE """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, targets):
+        """ 'targets' is dict mapping server key to object having 'client' and 'key_prefixes' """
+        self.targets = targets
+        self.keys = {}
+
+    def take(self):
+        """ (RedisSnapshot) -> (RedisSnapshot)
+        dump every key (only keys with configured prefixes, if any) of every database.
+        """
+        with redis_listener.suspended():
+            for server_key, target in self.targets.items():
+                patterns = ['{0}:*'.format(key_prefix) for key_prefix in target.key_prefixes] or ['*']
+                keys = [redis_key(key) for pattern in patterns for key in target.client.scan_iter(match = pattern, count = self.BATCH_SIZE)]
+                self.keys[server_key] = dict(zip(keys, self._dump(target.client, keys)))
+
+        return self
+
+    def _dump(self, client, keys):
+        dumps = []
+
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            pipeline = client.pipeline(transaction = False)
+
+            for key in keys[start:start + self.BATCH_SIZE]:
+                pipeline.pttl(key)
+                pipeline.dump(key)
+
+            response = pipeline.execute()
+            dumps.extend(zip(response[::2], response[1::2]))
+
+        return dumps
+
+    def restore(self, cleaned):
+        """ (RedisSnapshot, dict) -> (NoneType)
+        restore snapshot keys deleted by cleanup.
+
+        'cleaned' maps server key to set of deleted keys, or None if whole database was cleared.
+        """
+        with redis_listener.suspended():
+            for server_key, deleted_keys in cleaned.items():
+                snapshot = self.keys.get(server_key)
+
+                if not snapshot:
+                    continue
+
+                keys = list(snapshot) if deleted_keys is None else [key for key in deleted_keys if key in snapshot]
+                self._restore(self.targets[server_key].client, snapshot, keys)
+
+    def _restore(self, client, snapshot, keys):
+        pipeline = client.pipeline(transaction = False)
+
+        for key in keys:
+            ttl, payload = snapshot[key]
+
+            if payload is not None and ttl != -2:
+                pipeline.restore(key, max(ttl, 0), payload, replace = True)
+
+        pipeline.execute()
+
+    def discard(self):
+        """ (RedisSnapshot) -> (NoneType)
+        delete every snapshot key.
+        """
+        with redis_listener.suspended():
+            for server_key, snapshot in self.keys.items():
+                keys = list(snapshot)
+
+                for start in range(0, len(keys), self.BATCH_SIZE):
+                    self.targets[server_key].client.unlink(*keys[start:start + self.BATCH_SIZE])
+
+
+class Neo4jSnapshot(object):
+
+    """ Export of nodes and relationships, restored with batched UNWIND ... CREATE """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, graph, namespace = None):
+        self.graph = graph
+        self.namespace = namespace
+        self.nodes = defaultdict(list)
+        self.relationships = defaultdict(list)
+
+    def take(self):
+        """ (Neo4jSnapshot) -> (Neo4jSnapshot)
+        export every node (only nodes with 'namespace' label, if given) and relationship between them.
+        """
+        label = ':{0}'.format(self.namespace) if self.namespace else ''
+
+        for node_id, labels, node in self.graph.cypher.execute('MATCH (n{0}) RETURN id(n), labels(n), n'.format(label)):
+            self.nodes[tuple(sorted(labels))].append({'id': node_id, 'properties': dict(node.properties)})
+
+        query = 'MATCH (a{0})-[r]->(b{0}) RETURN id(a), id(b), type(r), r'.format(label)
+
+        for start_id, end_id, relationship_type, relationship in self.graph.cypher.execute(query):
+            self.relationships[relationship_type].append({'start': start_id, 'end': end_id, 'properties': dict(relationship.properties)})
+
+        return self
+
+    def restore(self):
+        """ (Neo4jSnapshot) -> (NoneType)
+        recreate exported nodes and relationships, in batches of BATCH_SIZE.
+
+        Restored entities get new ids.
+        """
+        new_ids = {}
+
+        for labels, rows in sorted(self.nodes.items()):
+            query = 'UNWIND {{rows}} AS row CREATE (n{0}) SET n = row.properties RETURN row.id, id(n)'.format(''.join(':`{0}`'.format(label) for label in labels))
+
+            for batch in self._batches(rows):
+                new_ids.update((old_id, new_id) for old_id, new_id in self.graph.cypher.execute(query, {'rows': batch}))
+
+        for relationship_type, rows in sorted(self.relationships.items()):
+            query = 'UNWIND {{rows}} AS row MATCH (a), (b) WHERE id(a) = row.start AND id(b) = row.end CREATE (a)-[r:`{0}`]->(b) SET r = row.properties'.format(relationship_type)
+            rows = [dict(row, start = new_ids[row['start']], end = new_ids[row['end']]) for row in rows]
+
+            for batch in self._batches(rows):
+                self.graph.cypher.execute(query, {'rows': batch})
+
+    def _batches(self, rows):
+        for start in range(0, len(rows), self.BATCH_SIZE):
+            yield rows[start:start + self.BATCH_SIZE]
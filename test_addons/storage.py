@@ -0,0 +1,430 @@
+# inbuild python imports
+import errno
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+
+
+# directories tried, in order, for per test storage on tmpfs
+TMPFS_DIRECTORIES = ('/dev/shm', '/run/shm')
+
+# prefix of per test storage directories, followed by '<pid>_<counter>'
+DIRECTORY_PREFIX = 'test_addons_'
+
+
+def tmpfs_directory():
+    """ (NoneType) -> (str or NoneType)
+    return writable directory on tmpfs (memory backed filesystem), or None if there is none.
+    """
+    for directory in TMPFS_DIRECTORIES:
+        if os.path.isdir(directory) and os.access(directory, os.W_OK | os.X_OK):
+            return directory
+
+    return None
+
+
+class DirectoryRemover(object):
+
+    """ Remove directory trees in a background thread, off the critical path of tests.
+
+    Removal is queued with 'remove' and finished by 'wait', called at process exit.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def remove(self, path):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target = self._run, name = 'test_addons_directory_remover')
+                self._thread.daemon = True
+                self._thread.start()
+
+        self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+
+            try:
+                shutil.rmtree(path, ignore_errors = True)
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """ (DirectoryRemover) -> (NoneType)
+        block until every queued directory is removed.
+        """
+        self._queue.join()
+
+
+directory_remover = DirectoryRemover()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno == errno.EPERM
+
+    return True
+
+
+def remove_stale_directories(base_directory):
+    """ (str) -> (NoneType)
+    queue removal of per test directories in 'base_directory' left by processes no longer running.
+
+    Directories of other running processes (e.g. parallel test workers) are kept.
+    """
+    try:
+        names = os.listdir(base_directory)
+    except OSError:
+        return
+
+    for name in names:
+        pid = name[len(DIRECTORY_PREFIX):].split('_', 1)[0]
+
+        if name.startswith(DIRECTORY_PREFIX) and pid.isdigit() and not _pid_alive(int(pid)):
+            directory_remover.remove(os.path.join(base_directory, name))
+
+
+class FileTracker(object):
+
+    """ Record path of every file saved through django's FileSystemStorage while active.
+
+    Storage's '_save' is wrapped (once per process) to report files to the active trackers.
+    """
+
+    _active = []
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.paths = []
+
+    @classmethod
+    def _install(cls):
+        from django.core.files.storage import FileSystemStorage
+
+        if getattr(FileSystemStorage._save, 'tracked', False):
+            return
+
+        original_save = FileSystemStorage._save
+
+        def _save(storage, name, content):
+            name = original_save(storage, name, content)
+
+            for tracker in list(cls._active):
+                tracker.paths.append(storage.path(name))
+
+            return name
+
+        _save.tracked = True
+        FileSystemStorage._save = _save
+
+    def start(self):
+        self._install()
+
+        with self._lock:
+            self._active.append(self)
+
+    def stop(self):
+        with self._lock:
+            if self in self._active:
+                self._active.remove(self)
+
+
+class TestStorage(object):
+
+    """ Storage directory of a single test, with files created in it through django's storage API tracked.
+
+    'cleanup' removes only the tracked files inside the directory or other 'roots'
+    (and directories left empty by it), if anything else remains the directory
+    is removed in background.
+    """
+
+    _counter = itertools.count()
+
+    def __init__(self, base_directory, roots = ()):
+        if not os.path.isdir(base_directory):
+            os.makedirs(base_directory)
+
+        self.directory = os.path.join(base_directory, '{0}{1}_{2}'.format(DIRECTORY_PREFIX, os.getpid(), next(self._counter)))
+        os.mkdir(self.directory)
+        self.roots = [os.path.abspath(root) for root in (self.directory, ) + tuple(roots)]
+        self.tracker = FileTracker()
+        self.tracker.start()
+
+    def cleanup(self):
+        self.tracker.stop()
+
+        for path in self.tracker.paths:
+            root = self._root(path)
+
+            if root is None:
+                continue
+
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by the test itself
+                continue
+
+            self._remove_empty_parents(os.path.dirname(path), root)
+
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            # holds files not created through storage API
+            directory_remover.remove(self.directory)
+
+    def track(self, path):
+        """ (TestStorage, str) -> (NoneType)
+        remove 'path' on cleanup, like a file saved through storage API.
+        """
+        self.tracker.paths.append(path)
+
+    def _root(self, path):
+        path = os.path.abspath(path)
+
+        for root in self.roots:
+            if path.startswith(root + os.sep):
+                return root
+
+        return None
+
+    def _remove_empty_parents(self, directory, root):
+        while os.path.abspath(directory).startswith(root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+
+            directory = os.path.dirname(directory)
+
+
+def storage_base_directory(storage_directory, use_tmpfs = True):
+    """ (str, bool) -> (str)
+    return directory holding per test directories, on tmpfs when available and 'use_tmpfs',
+    else 'storage_directory' itself.
+    """
+    tmpfs = tmpfs_directory() if use_tmpfs else None
+
+    if tmpfs is None:
+        return storage_directory
+
+    return os.path.join(tmpfs, 'test_addons_storage')
+
+
+# ioctl request cloning a file on copy-on-write filesystems (btrfs, xfs, ...), from linux/fs.h
+FICLONE = 0x40049409
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def reflink(source, destination):
+    """ (str, str) -> (NoneType)
+    create 'destination' sharing blocks of 'source' until either is modified.
+
+    Raises OSError if the filesystem (or platform) does not support it.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, 'reflink is not supported on this platform')
+
+    with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+        try:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+        except (IOError, OSError):
+            destination_file.close()
+            os.remove(destination)
+            raise
+
+
+def _copy_file_range(source_file, destination_file, size):
+    offset = 0
+
+    while offset < size:
+        copied = os.copy_file_range(source_file.fileno(), destination_file.fileno(), min(COPY_CHUNK_SIZE, size - offset), offset, offset)
+
+        if not copied:
+            break
+
+        offset += copied
+
+
+def _sendfile(source_file, destination_file, size):
+    offset = 0
+
+    while offset < size:
+        sent = os.sendfile(destination_file.fileno(), source_file.fileno(), offset, min(COPY_CHUNK_SIZE, size - offset))
+
+        if not sent:
+            break
+
+        offset += sent
+
+
+def copy_file(source, destination):
+    """ (str, str) -> (NoneType)
+    copy 'source' to 'destination' inside the kernel, with copy_file_range or sendfile,
+    falling back to copying through python buffers.
+    """
+    with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+        size = os.fstat(source_file.fileno()).st_size
+
+        for copy in (_copy_file_range, _sendfile):
+            try:
+                copy(source_file, destination_file, size)
+                return
+            except (AttributeError, OSError):
+                # not available on this platform or filesystem, start over with next one
+                destination_file.seek(0)
+                destination_file.truncate()
+
+        shutil.copyfileobj(source_file, destination_file, COPY_CHUNK_SIZE)
+
+
+def provision_file(source, destination, read_only = False):
+    """ (str, str, bool) -> (str)
+    create 'destination' with content of 'source' the cheapest way possible, return the way used:
+    'reflink', 'hardlink' (only if 'read_only', the files then share content) or 'copy'.
+    """
+    try:
+        reflink(source, destination)
+        return 'reflink'
+    except (IOError, OSError):
+        pass
+
+    if read_only:
+        try:
+            os.link(source, destination)
+            return 'hardlink'
+        except OSError:
+            pass
+
+    copy_file(source, destination)
+    os.chmod(destination, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+
+    return 'copy'
+
+
+class FixtureCache(object):
+
+    """ Content addressed copies of large fixture files, kept on the filesystem of test storage directories.
+
+    A fixture is hashed once per (path, size, modification time) and copied into the
+    cache once per content, even across runs. Tests get reflinks, hardlinks or copies
+    of cached file, which never leave the filesystem. Cached files are read-only.
+    """
+
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._index = None
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another worker meanwhile
+                pass
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(os.path.join(self.directory, self.INDEX_NAME)) as index_file:
+                    self._index = json.load(index_file)
+            except (IOError, OSError, ValueError):
+                self._index = {}
+
+        return self._index
+
+    def _save_index(self):
+        handle, path = tempfile.mkstemp(dir = self.directory)
+
+        with os.fdopen(handle, 'w') as index_file:
+            json.dump(self._index, index_file)
+
+        os.rename(path, os.path.join(self.directory, self.INDEX_NAME))
+
+    def digest(self, path):
+        """ (FixtureCache, str) -> (str)
+        return sha256 of content of 'path', computed only if file changed since last call.
+        """
+        path = os.path.abspath(path)
+        status = os.stat(path)
+        key = '{0}:{1}:{2}'.format(path, status.st_size, status.st_mtime)
+
+        with self._lock:
+            index = self._load_index()
+
+            if key not in index:
+                sha = hashlib.sha256()
+
+                with open(path, 'rb') as fixture_file:
+                    for chunk in iter(lambda: fixture_file.read(COPY_CHUNK_SIZE), b''):
+                        sha.update(chunk)
+
+                index[key] = sha.hexdigest()
+                self._save_index()
+
+            return index[key]
+
+    def get(self, path):
+        """ (FixtureCache, str) -> (str)
+        return path of cached copy of fixture 'path', copying it into the cache if its content is new.
+        """
+        cached = os.path.join(self.directory, self.digest(path))
+
+        if not os.path.exists(cached):
+            handle, temporary = tempfile.mkstemp(dir = self.directory)
+            os.close(handle)
+            os.remove(temporary)
+            provision_file(path, temporary)
+            os.chmod(temporary, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            # atomic, parallel workers provisioning same fixture end up with one of the copies
+            os.rename(temporary, cached)
+
+        return cached
+
+    def provision(self, path, destination, read_only = False):
+        """ (FixtureCache, str, str, bool) -> (str)
+        create 'destination' with content of fixture 'path', return the way used, see provision_file.
+        """
+        return provision_file(self.get(path), destination, read_only)
+
+
+_fixture_caches = {}
+
+
+def fixture_cache(base_directory):
+    """ (str) -> (FixtureCache)
+    return fixture cache kept in 'base_directory', holding per test directories.
+    """
+    if base_directory not in _fixture_caches:
+        _fixture_caches[base_directory] = FixtureCache(os.path.join(base_directory, 'fixture_cache'))
+
+    return _fixture_caches[base_directory]
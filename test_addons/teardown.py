@@ -0,0 +1,172 @@
+# inbuild python imports
+import contextlib
+import threading
+from collections import OrderedDict
+
+# inbuilt django imports
+
+# third party imports
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # python 2 without 'futures' backport, cleanups run one after another
+    ThreadPoolExecutor = None
+
+# inter-app imports
+
+# local imports
+from .monitoring import _timer
+from .timing import timing_report
+
+
+MAX_WORKERS = 4
+
+_executor = {
+    'pool': None,
+    'lock': threading.Lock(),
+}
+
+
+def _get_executor():
+    with _executor['lock']:
+        if _executor['pool'] is None:
+            _executor['pool'] = ThreadPoolExecutor(max_workers = MAX_WORKERS)
+
+        return _executor['pool']
+
+
+class TeardownError(Exception):
+
+    """ Raised when more than one backend cleanup failed, 'errors' lists (name, exception) in registration order """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(TeardownError, self).__init__('{0} cleanups failed: {1}'.format(
+            len(errors), '; '.join('{0}: {1!r}'.format(name, error) for name, error in errors)))
+
+
+class TeardownCoordinator(object):
+
+    """ Collect independent backend cleanups of a test and run them concurrently.
+
+    Cleanups run on a small shared thread pool, so teardown of a test using
+    several backends takes about as long as the slowest one. A single
+    cleanup is run in calling thread. Cleanups registered by add_first run
+    in calling thread, one after another, before the others start.
+    """
+
+    def __init__(self):
+        self.first_cleanups = []
+        self.cleanups = []
+        self.durations = OrderedDict()
+
+    def add(self, name, func, *args):
+        """ (TeardownCoordinator, str, callable, *object) -> (NoneType)
+        register 'func' to be called with 'args' by run.
+        """
+        self.cleanups.append((name, func, args))
+
+    def add_first(self, name, func, *args):
+        """ (TeardownCoordinator, str, callable, *object) -> (NoneType)
+        register 'func' to be called with 'args' by run, before cleanups registered by add,
+        e.g. one clearing data other cleanups restore.
+        """
+        self.first_cleanups.append((name, func, args))
+
+    def run(self):
+        """ (TeardownCoordinator) -> (NoneType)
+        run every registered cleanup, waiting for all of them even if some fail.
+
+        Single failure is re-raised as is, several are raised together as TeardownError.
+        """
+        first_cleanups = [(name, self._timed, (name, func, args)) for name, func, args in self.first_cleanups]
+        cleanups = [(name, self._timed, (name, func, args)) for name, func, args in self.cleanups]
+        self.first_cleanups, self.cleanups = [], []
+
+        errors = self._run_serially(first_cleanups)
+
+        if len(cleanups) < 2 or ThreadPoolExecutor is None:
+            errors.extend(self._run_serially(cleanups))
+        else:
+            errors.extend(self._run_concurrently(cleanups))
+
+        if len(errors) == 1:
+            raise errors[0][1]
+
+        if errors:
+            raise TeardownError(errors)
+
+    def _timed(self, name, func, args):
+        start = _timer()
+
+        try:
+            func(*args)
+        finally:
+            self.durations[name] = _timer() - start
+
+    def _run_serially(self, cleanups):
+        errors = []
+
+        for name, func, args in cleanups:
+            try:
+                func(*args)
+            except Exception as exc:
+                errors.append((name, exc))
+
+        return errors
+
+    def _run_concurrently(self, cleanups):
+        executor = _get_executor()
+        futures = [(name, executor.submit(func, *args)) for name, func, args in cleanups]
+        errors = []
+
+        # results are collected in registration order, so reported errors do not depend on timing
+        for name, future in futures:
+            exception = future.exception()
+
+            if exception is not None:
+                errors.append((name, exception))
+
+        return errors
+
+
+@contextlib.contextmanager
+def teardown_scope(test_case):
+    """ (TestCase) -> (TeardownCoordinator)
+    context manager yielding coordinator shared by every mixin's _post_teardown of 'test_case'.
+
+    Outermost mixin in MRO creates the coordinator and runs registered cleanups when its
+    scope exits, after every inner _post_teardown has registered its own.
+    """
+    coordinator = getattr(test_case, '_teardown_coordinator', None)
+
+    if coordinator is not None:
+        yield coordinator
+        return
+
+    coordinator = test_case._teardown_coordinator = TeardownCoordinator()
+
+    try:
+        yield coordinator
+    except BaseException as exc:
+        del test_case._teardown_coordinator
+
+        try:
+            _run_cleanups(test_case, coordinator)
+        except Exception as cleanup_error:
+            # failure of inner _post_teardown is not replaced by cleanup's, which is chained to it
+            exc.__cause__ = cleanup_error
+
+        raise exc
+    else:
+        del test_case._teardown_coordinator
+        _run_cleanups(test_case, coordinator)
+
+
+def _run_cleanups(test_case, coordinator):
+    with timing_report.phase(test_case, 'teardown'):
+        try:
+            coordinator.run()
+        finally:
+            for name, duration in coordinator.durations.items():
+                timing_report.add(test_case, '{0}.teardown'.format(name), duration)
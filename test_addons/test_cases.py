@@ -2,6 +2,7 @@
 
 # inbuilt django imports
 from django.test import LiveServerTestCase, SimpleTestCase
+from django.test.utils import modify_settings, override_settings
 
 # third party imports
 
@@ -27,8 +28,35 @@ class SimpleTestCase(SimpleTestCase):
             cls._cls_modified_context = modify_settings(cls._modified_settings)
             cls._cls_modified_context.enable()
 
+        if cls._has_test_data():
+            cls.setUpTestData()
+            cls._snapshot_test_data()
+
+    @classmethod
+    def setUpTestData(cls):
+        """ Load class level fixtures, run once per class.
+
+        Resulting state of every backend is snapshot and restored after each
+        test, whenever test changed it.
+        """
+        pass
+
+    @classmethod
+    def _has_test_data(cls):
+        return cls.setUpTestData.__func__ is not SimpleTestCase.setUpTestData.__func__
+
+    @classmethod
+    def _snapshot_test_data(cls):
+        pass
+
+    @classmethod
+    def _discard_test_data(cls):
+        pass
+
     @classmethod
     def tearDownClass(cls):
+        cls._discard_test_data()
+
         if hasattr(cls, '_cls_modified_context'):
             cls._cls_modified_context.disable()
             delattr(cls, '_cls_modified_context')
@@ -45,10 +73,46 @@ class MongoTestCase(mixins.MongoTestMixin, SimpleTestCase):
     pass
 
 
-class MongoLiveServerTestCase(mixins.MongoTestMixin, LiveServerTestCase):
+class _LiveServerPreSetup(object):
+
+    """ _pre_setup of MongoLiveServerTestCase.
+
+    From Django 5.1 TransactionTestCase.setUpClass calls cls._pre_setup() and skips
+    _pre_setup before the first test. Called on class, only Django's part runs,
+    called on instance, Django's part runs unless it did so in setUpClass, and
+    MongoTestMixin's part always.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return super(mixins.MongoTestMixin, owner)._pre_setup
+
+        def _pre_setup():
+            if owner._django_pre_setup_ran:
+                owner._django_pre_setup_ran = False
+                instance._setup_mongo()
+            else:
+                mixins.MongoTestMixin._pre_setup(instance)
+
+        return _pre_setup
+
+
+class MongoLiveServerTestCase(mixins.LoadTestMixin, mixins.MongoTestMixin, LiveServerTestCase):
+
+    """ TestCase that runs liveserver using mongodb instead of relational database, see generate_load for load testing it """
+
+    _django_pre_setup_ran = False
+    _pre_setup = _LiveServerPreSetup()
+
+    @classmethod
+    def setUpClass(cls):
+        super(MongoLiveServerTestCase, cls).setUpClass()
+
+        # take over from Django, which would skip mongo setup of first test as well
+        if getattr(cls, '_pre_setup_ran_eagerly', False):
+            cls._pre_setup_ran_eagerly = False
+            cls._django_pre_setup_ran = True
 
-    """ TestCase that runs liveserver using mongodb instead of relational database  """
-    pass
 
 class Neo4jTestCase(mixins.Neo4jTestMixin, SimpleTestCase):
 
@@ -98,7 +162,3 @@ class APIMongoRedisTestCase(mixins.ApiTestMixin, MongoRedisTestCase):
 class APIRedisMongoNeo4jTestCase(mixins.ApiTestMixin, RedisMongoNeo4jTestCase):
 
     pass
-
-
-
-
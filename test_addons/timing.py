@@ -0,0 +1,215 @@
+# inbuild python imports
+import contextlib
+import json
+import threading
+from collections import OrderedDict, defaultdict
+from xml.etree import ElementTree
+
+# inbuilt django imports
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+from .monitoring import (IGNORED_COMMANDS, REDIS_IGNORED_COMMANDS, CommandSubscriber, GraphSubscriber, RedisSubscriber, _timer,
+    command_listener, redis_command_name, redis_listener)
+
+
+class TestTiming(object):
+
+    """ Time spent in each phase of a single test and number of database commands it issued.
+
+    Phases are named '<backend>.<phase>', e.g. 'mongo.setup' or 'redis.teardown',
+    'teardown' is the wall time of all (concurrent) backend cleanups together.
+    Body (setUp, test method and tearDown) is timed by test result, see runner.
+    """
+
+    def __init__(self, test_id):
+        self.test_id = test_id
+        self.phases = defaultdict(float)
+        self.commands = defaultdict(int)
+        self.started = None
+        self.body = None
+
+    @property
+    def class_name(self):
+        return self.test_id.rsplit('.', 1)[0]
+
+    @property
+    def overhead(self):
+        """ seconds spent setting up and cleaning backends """
+        return sum(duration for phase, duration in self.phases.items() if phase.endswith('.setup')) + self.phases.get('teardown', 0.0)
+
+    @property
+    def total(self):
+        return self.overhead + (self.body or 0.0)
+
+    def as_dict(self):
+        return OrderedDict([
+            ('test', self.test_id),
+            ('total', self.total),
+            ('body', self.body),
+            ('overhead', self.overhead),
+            ('phases', OrderedDict(sorted(self.phases.items()))),
+            ('commands', OrderedDict(sorted(self.commands.items()))),
+        ])
+
+
+class TimingReport(CommandSubscriber, RedisSubscriber, GraphSubscriber):
+
+    """ Collect TestTiming of every test run while enabled.
+
+    Database commands are counted for the test currently running in the process,
+    from its backend setup to its cleanups, including ones sent from other threads.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.tests = OrderedDict()
+        self._current = None
+        self._lock = threading.Lock()
+
+    def enable(self):
+        if self.enabled:
+            return
+
+        self.enabled = True
+        command_listener.subscribe(self)
+        redis_listener.subscribe(self)
+
+    def disable(self):
+        self.enabled = False
+        command_listener.unsubscribe(self)
+        redis_listener.unsubscribe(self)
+
+    def clear(self):
+        with self._lock:
+            self.tests.clear()
+            self._current = None
+
+    def _timing(self, test):
+        test_id = test.id()
+
+        with self._lock:
+            if test_id not in self.tests:
+                self.tests[test_id] = TestTiming(test_id)
+
+            return self.tests[test_id]
+
+    def start_test(self, test):
+        if self.enabled:
+            self._current = self._timing(test)
+            self._current.started = _timer()
+
+    def stop_test(self, test):
+        if self.enabled and self._current is not None and self._current.started is not None:
+            self._current.body = _timer() - self._current.started
+
+    @contextlib.contextmanager
+    def phase(self, test, name):
+        """ (TimingReport, TestCase, str) -> (NoneType)
+        context manager adding time spent inside it to phase 'name' of 'test'.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        self._current = self._timing(test)
+        start = _timer()
+
+        try:
+            yield
+        finally:
+            self.add(test, name, _timer() - start)
+
+    def add(self, test, name, duration):
+        if self.enabled:
+            timing = self._timing(test)
+
+            with self._lock:
+                timing.phases[name] += duration
+
+    def _count(self, backend, num = 1):
+        timing = self._current
+
+        if timing is not None:
+            with self._lock:
+                timing.commands[backend] += num
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self._count('mongo')
+
+    def redis_round_trip(self, round_trip):
+        self._count('redis', len([args for args in round_trip.commands if redis_command_name(args) not in REDIS_IGNORED_COMMANDS]))
+
+    def cypher_executed(self, query):
+        self._count('cypher')
+
+    def slowest_tests(self, num = 10):
+        """ (TimingReport, int) -> (list)
+        return 'num' TestTiming with most setup and teardown overhead.
+        """
+        return sorted(self.tests.values(), key = lambda timing: (-timing.overhead, timing.test_id))[:num]
+
+    def slowest_classes(self, num = 10):
+        """ (TimingReport, int) -> (list)
+        return 'num' (class name, overhead, total, number of tests) with most setup and teardown overhead.
+        """
+        classes = OrderedDict()
+
+        for timing in self.tests.values():
+            overhead, total, num_of_tests = classes.get(timing.class_name, (0.0, 0.0, 0))
+            classes[timing.class_name] = (overhead + timing.overhead, total + timing.total, num_of_tests + 1)
+
+        return sorted(((name, ) + values for name, values in classes.items()), key = lambda item: (-item[1], item[0]))[:num]
+
+    def summary(self, num = 10):
+        """ (TimingReport, int) -> (str)
+        return human readable summary of slowest tests and classes.
+        """
+        overhead = sum(timing.overhead for timing in self.tests.values())
+        total = sum(timing.total for timing in self.tests.values())
+        lines = ['Backend setup/teardown: {0:.2f}s of {1:.2f}s in {2} tests'.format(overhead, total, len(self.tests))]
+
+        lines.append('Slowest tests (overhead, total, phases, commands):')
+
+        for timing in self.slowest_tests(num):
+            lines.append('  {0:8.3f}s {1:8.3f}s  {2}  {3}  {4}'.format(
+                timing.overhead, timing.total, timing.test_id,
+                ' '.join('{0}={1:.3f}'.format(phase, duration) for phase, duration in sorted(timing.phases.items())),
+                ' '.join('{0}={1}'.format(backend, count) for backend, count in sorted(timing.commands.items()))))
+
+        lines.append('Slowest classes (overhead, total, tests):')
+
+        for name, class_overhead, class_total, num_of_tests in self.slowest_classes(num):
+            lines.append('  {0:8.3f}s {1:8.3f}s  {2:4d}  {3}'.format(class_overhead, class_total, num_of_tests, name))
+
+        return '\n'.join(lines)
+
+    def to_json(self, path):
+        with open(path, 'w') as report_file:
+            json.dump({'tests': [timing.as_dict() for timing in self.tests.values()]}, report_file, indent = 2)
+
+    def to_junit(self, path):
+        """ (TimingReport, str) -> (NoneType)
+        write JUnit XML, with phase durations and command counts as properties of every testcase.
+        """
+        suite = ElementTree.Element('testsuite', name = 'test_addons.timing', tests = str(len(self.tests)))
+
+        for timing in self.tests.values():
+            class_name, name = timing.test_id.rsplit('.', 1)
+            case = ElementTree.SubElement(suite, 'testcase', classname = class_name, name = name, time = '{0:.6f}'.format(timing.total))
+            properties = ElementTree.SubElement(case, 'properties')
+
+            for phase, duration in sorted(timing.phases.items()):
+                ElementTree.SubElement(properties, 'property', name = 'time.{0}'.format(phase), value = '{0:.6f}'.format(duration))
+
+            for backend, count in sorted(timing.commands.items()):
+                ElementTree.SubElement(properties, 'property', name = 'commands.{0}'.format(backend), value = str(count))
+
+        ElementTree.ElementTree(suite).write(path, encoding = 'utf-8', xml_declaration = True)
+
+
+timing_report = TimingReport()
@@ -0,0 +1,169 @@
+# inbuild python imports
+import mimetypes
+import mmap
+import os
+import uuid
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+# inbuilt django imports
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.encoding import force_bytes
+
+# third party imports
+
+# inter-app imports
+
+# local imports
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def mmap_file(path):
+    """ (str) -> (mmap or bytes)
+    return read-only memory map of file at 'path', pages are read from disk only when accessed.
+
+    Empty files cannot be mapped, b'' is returned for them. Caller closes the map.
+    """
+    with open(path, 'rb') as mapped_file:
+        if not os.fstat(mapped_file.fileno()).st_size:
+            return b''
+
+        # map stays valid after file is closed
+        return mmap.mmap(mapped_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+
+class StreamingUploadedFile(UploadedFile):
+
+    """ UploadedFile reading a file from disk in chunks, instead of holding its content in memory
+    like SimpleUploadedFile.
+
+    Usable as a form or model field value in tests, and posted as a stream by post_streaming.
+    """
+
+    DEFAULT_CHUNK_SIZE = STREAM_CHUNK_SIZE
+
+    def __init__(self, path, name = None, content_type = None, charset = None):
+        name = name or os.path.basename(path)
+        content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+        super(StreamingUploadedFile, self).__init__(open(path, 'rb'), name, content_type, os.path.getsize(path), charset)
+        self.path = path
+
+
+class MultipartStream(object):
+
+    """ File-like multipart/form-data body, produced part by part as it is read.
+
+    Values of 'data' that are files (anything with 'read') are read in chunks,
+    other values are sent as form fields, lists as repeated fields.
+    """
+
+    def __init__(self, data, boundary = None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self._parts = []
+
+        for key, values in data.items():
+            for value in (values if isinstance(values, (list, tuple)) else [values]):
+                if hasattr(value, 'read'):
+                    self._add_file(key, value)
+                else:
+                    self._add_bytes(self._header(key), force_bytes(value), b'\r\n')
+
+        self._add_bytes(force_bytes('--{0}--\r\n'.format(self.boundary)))
+        self.length = sum(size for _, size in self._parts)
+        self._position = 0
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary={0}'.format(self.boundary)
+
+    def _header(self, key, filename = None, content_type = None):
+        header = '--{0}\r\nContent-Disposition: form-data; name="{1}"'.format(self.boundary, key)
+
+        if filename is not None:
+            header += '; filename="{0}"\r\nContent-Type: {1}'.format(filename, content_type)
+
+        return force_bytes(header + '\r\n\r\n')
+
+    def _add_bytes(self, *chunks):
+        for chunk in chunks:
+            self._parts.append((chunk, len(chunk)))
+
+    def _add_file(self, key, file_object):
+        name = os.path.basename(getattr(file_object, 'name', None) or key)
+        content_type = getattr(file_object, 'content_type', None) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        size = getattr(file_object, 'size', None)
+
+        if size is None:
+            size = os.fstat(file_object.fileno()).st_size
+
+        if hasattr(file_object, 'seek'):
+            file_object.seek(0)
+
+        self._add_bytes(self._header(key, name, content_type))
+        self._parts.append((file_object, size))
+        self._add_bytes(b'\r\n')
+
+    def read(self, size = -1):
+        if size is None or size < 0:
+            size = self.length - self._position
+
+        chunks = []
+
+        while size > 0 and self._parts:
+            part, remaining = self._parts[0]
+            num = min(size, remaining)
+
+            if isinstance(part, bytes):
+                chunk = part[:num]
+                self._parts[0] = (part[num:], remaining - num)
+            else:
+                chunk = part.read(num)
+                self._parts[0] = (part, remaining - len(chunk))
+
+                if not chunk:
+                    raise IOError('file {0!r} is shorter than its size'.format(getattr(part, 'name', part)))
+
+            if self._parts[0][1] == 0:
+                self._parts.pop(0)
+
+            chunks.append(chunk)
+            size -= len(chunk)
+            self._position += len(chunk)
+
+        return b''.join(chunks)
+
+    def readline(self, size = -1):
+        # multipart parser reads whole chunks, lines are only needed to satisfy WSGI input spec
+        return self.read(size)
+
+
+def post_streaming(client, path, data, secure = False, **extra):
+    """ (Client, str, dict, bool, **str) -> (HttpResponse)
+    post 'data' with django test 'client' (or rest framework's APIClient) as multipart body
+    streamed from files in it, without building the body in memory.
+
+    Uploads bigger than FILE_UPLOAD_MAX_MEMORY_SIZE are written to temporary files by
+    django's upload handlers, so memory stays bounded on server side too.
+    """
+    stream = MultipartStream(data)
+    parsed = urlsplit(str(path))
+
+    environ = {
+        'PATH_INFO': client._get_path(parsed),
+        'QUERY_STRING': parsed.query,
+        'REQUEST_METHOD': 'POST',
+        'SERVER_PORT': '443' if secure else '80',
+        'wsgi.url_scheme': 'https' if secure else 'http',
+        'CONTENT_LENGTH': str(stream.length),
+        'CONTENT_TYPE': stream.content_type,
+        'wsgi.input': stream,
+    }
+    environ.update(extra)
+
+    return client.request(**environ)
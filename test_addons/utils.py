@@ -1,28 +1,93 @@
 # inbuilt python imports
+import atexit
+import multiprocessing.util
 import os
-import shutil
+import threading
 
 # inbuild django imports
 from django.http import HttpRequest
 from django.conf import settings
-from django.utils.module_loading import import_module
+from django.test.utils import override_settings
 
 # third-party django imports
-from mongoengine.connection import (DEFAULT_CONNECTION_NAME, _connections, get_connection,
-    _dbs)
 
 # inter-app imports
 
 # local imports
+from .backends import LazyImport
+from .monitoring import command_listener
+from .sessions import get_session_engine, memory_session_store_class
+from .uploads import StreamingUploadedFile, mmap_file, post_streaming
+from .storage import TestStorage, directory_remover, fixture_cache, remove_stale_directories, storage_base_directory
+
+# imported on first use, so projects not using mongo never import mongoengine
+mongo_connection = LazyImport('mongoengine', 'connection')
+
+# same as mongoengine.connection.DEFAULT_CONNECTION_NAME
+DEFAULT_CONNECTION_NAME = 'default'
 
 class EnhancedHttpRequest(HttpRequest):
+    """
+    HttpRequest with a fresh session of SESSION_ENGINE. With in_memory_session
+    the session is kept in process memory, even when views save or cycle it,
+    and written to the session backend only by request.session.persist().
+    """
 
-    def __init__(self, method = 'GET'):
+    def __init__(self, method = 'GET', in_memory_session = False):
         super(EnhancedHttpRequest, self).__init__()
         self.method = method
 
-        session_engine = import_module(settings.SESSION_ENGINE)
-        self.session = session_engine.SessionStore(session_key = None)
+        if in_memory_session:
+            self.session = memory_session_store_class()(session_key = None)
+        else:
+            self.session = get_session_engine().SessionStore(session_key = None)
+
+    @classmethod
+    def bulk(cls, num, method = 'GET', path = '/', user = None, session_data = None, persist_sessions = False, in_memory_session = True):
+        """ (type, int, str, str, User, dict, bool, bool) -> (list)
+        return 'num' requests, logged in as 'user' (if given) with 'session_data' in their sessions.
+
+        Sessions are in memory (see in_memory_session), written to the backend only
+        if 'persist_sessions'. Login data is computed once for the whole batch.
+        """
+        session_data = dict(session_data or {})
+
+        if user is not None:
+            session_data.update(_login_session_data(user))
+
+        requests = []
+
+        for _ in range(num):
+            request = cls(method, in_memory_session = in_memory_session)
+            request.path = request.path_info = path
+
+            if user is not None:
+                request.user = user
+
+            if session_data:
+                request.session.update(session_data)
+
+            if persist_sessions:
+                if in_memory_session:
+                    request.session.persist()
+                else:
+                    request.session.save()
+
+            requests.append(request)
+
+        return requests
+
+
+def _login_session_data(user):
+    """ (User) -> (dict)
+    return session data django.contrib.auth.login stores for 'user'.
+    """
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+
+    backend = getattr(user, 'backend', None) or settings.AUTHENTICATION_BACKENDS[0]
+    session_auth_hash = user.get_session_auth_hash() if hasattr(user, 'get_session_auth_hash') else ''
+
+    return {SESSION_KEY: str(user.pk), BACKEND_SESSION_KEY: backend, HASH_SESSION_KEY: session_auth_hash}
 
 class TestViewMixin(object):
 
@@ -34,19 +99,59 @@ class TestViewMixin(object):
 
 
 class ClearFileStorageMixin(object):
+    """
+    Gives each test its own storage directory, set as MEDIA_ROOT while the test runs,
+    on tmpfs (e.g. /dev/shm) when available and USE_TMPFS, else inside TEST_STORAGE_DIRECTORY.
+    The directory is also available as self.TEST_STORAGE_DIRECTORY during the test.
+
+    Files saved through django's storage API are tracked and only those are removed
+    after the test, anything else left in the directory is removed in background.
+    """
 
     TEST_STORAGE_DIRECTORY = None
+    USE_TMPFS = True
+
+    _storage_base_directories = set()
+
+    def setUp(self):
+        super(ClearFileStorageMixin, self).setUp()
 
-    def tearDown(self):
         if self.TEST_STORAGE_DIRECTORY:
-            shutil.rmtree(self.TEST_STORAGE_DIRECTORY, ignore_errors = True)
-            os.makedirs(self.TEST_STORAGE_DIRECTORY)
+            self._test_storage = TestStorage(self._storage_base_directory(), roots = [self.TEST_STORAGE_DIRECTORY])
+            self.TEST_STORAGE_DIRECTORY = self._test_storage.directory
+            self._storage_settings = override_settings(MEDIA_ROOT = self._test_storage.directory)
+            self._storage_settings.enable()
+
+    def tearDown(self):
+        test_storage = self.__dict__.pop('_test_storage', None)
+
+        if test_storage is not None:
+            self._storage_settings.disable()
+            del self.TEST_STORAGE_DIRECTORY
+            test_storage.cleanup()
+
+        super(ClearFileStorageMixin, self).tearDown()
+
+    @classmethod
+    def _storage_base_directory(cls):
+        base_directory = storage_base_directory(cls.TEST_STORAGE_DIRECTORY, cls.USE_TMPFS)
+
+        if base_directory not in ClearFileStorageMixin._storage_base_directories:
+            ClearFileStorageMixin._storage_base_directories.add(base_directory)
+            remove_stale_directories(base_directory)
+
+            if len(ClearFileStorageMixin._storage_base_directories) == 1:
+                at_exit(directory_remover.wait)
+
+        return base_directory
 
     @classmethod
     def tearDownAll(cls):
-        if self.TEST_STORAGE_DIRECTORY:
-            shutil.rmtree(self.TEST_STORAGE_DIRECTORY, ignore_errors = True)
-            os.makedirs(self.TEST_STORAGE_DIRECTORY)
+        """ (type) -> (NoneType)
+        wait for background removal of storage directories of finished tests.
+        """
+        if cls.TEST_STORAGE_DIRECTORY:
+            directory_remover.wait()
 
 
 class CopyLargeFileMixin(ClearFileStorageMixin):
@@ -58,35 +163,87 @@ class CopyLargeFileMixin(ClearFileStorageMixin):
     A better approach is to copy the file each time you
     run the test from your computer to the TEST_STORAGE_DIRECTORY
     and delete it after each test run.
+
+    Files in STORED_FILE_PATHS (and STORED_FILE_PATH) are copied once per content
+    into a cache next to test directories, and each test gets a reflink of the
+    cached copy, or a hardlink if READ_ONLY_FIXTURES, or else a copy made inside
+    the kernel. Test directories are kept off tmpfs by default, large files
+    would otherwise take memory and could not be reflinked.
+
+    fixture_buffer and fixture_upload give access to a provided fixture without
+    reading it into memory, post_streaming uploads them with bounded memory.
     """
 
     STORED_FILE_PATH = None
+    STORED_FILE_PATHS = ()
+    READ_ONLY_FIXTURES = False
     TEST_STORAGE_DIRECTORY = None
+    USE_TMPFS = False
 
-    def tearDown(self):
-	if not self.STORED_FILE_PATH:
-            return super(CopyLargeFileMixin, self).tearDown()
+    def setUp(self):
+        super(CopyLargeFileMixin, self).setUp()
+
+        if not self.TEST_STORAGE_DIRECTORY:
+            return
+
+        cache = fixture_cache(self._storage_base_directory())
+
+        for path in self._stored_file_paths():
+            destination = os.path.join(self.TEST_STORAGE_DIRECTORY, os.path.basename(path))
+            cache.provision(path, destination, self.READ_ONLY_FIXTURES)
+            self._test_storage.track(destination)
+
+    def fixture_path(self, name):
+        """ (CopyLargeFileMixin, str) -> (str)
+        return path of fixture 'name' (its file name) provided in test storage directory.
+        """
+        return os.path.join(self.TEST_STORAGE_DIRECTORY, os.path.basename(name))
+
+    def fixture_buffer(self, name):
+        """ (CopyLargeFileMixin, str) -> (mmap)
+        return read-only memory mapped content of fixture 'name', closed after the test.
+        """
+        buffer = mmap_file(self.fixture_path(name))
+
+        if hasattr(buffer, 'close'):
+            self.addCleanup(buffer.close)
+
+        return buffer
+
+    def fixture_upload(self, name, content_type = None):
+        """ (CopyLargeFileMixin, str, str) -> (StreamingUploadedFile)
+        return uploaded file reading fixture 'name' in chunks, closed after the test.
+        """
+        upload = StreamingUploadedFile(self.fixture_path(name), content_type = content_type)
+        self.addCleanup(upload.close)
+
+        return upload
 
-	super(CopyLargeFileMixin, self).tearDown()
-	shutil.copy(self.STORED_FILE_PATH, self.TEST_STORAGE_DIRECTORY)
+    def post_streaming(self, path, data, client = None, **extra):
+        """ (CopyLargeFileMixin, str, dict, Client, **str) -> (HttpResponse)
+        post 'data' with 'client' (self.client by default) as multipart body streamed from its files.
+        """
+        return post_streaming(client or self.client, path, data, **extra)
 
     @classmethod
-    def tearDownAll(cls):
-	if not self.STORED_FILE_PATH:
-	    return super(CopyLargeFileMixin, cls).tearDownAll()
-        
-	super(CopyLargeFileMixin, cls).tearDownAll()
-	shutil.copy(self.STORED_FILE_PATH, self.TEST_STORAGE_DIRECTORY)
+    def _stored_file_paths(cls):
+        paths = list(cls.STORED_FILE_PATHS)
+
+        if cls.STORED_FILE_PATH and cls.STORED_FILE_PATH not in paths:
+            paths.insert(0, cls.STORED_FILE_PATH)
+
+        return paths
 
 
 class ModifySessionMixin(object):
 
     def create_session(self):
-        session_engine = import_module(settings.SESSION_ENGINE)
-        store = session_engine.SessionStore()
+        store = get_session_engine().SessionStore()
         store.save()
         self.client.cookies[settings.SESSION_COOKIE_NAME] = store.session_key
 
+        return store
+
 
 def disconnect(alias=DEFAULT_CONNECTION_NAME):
     """ To disconnect pymongo connection.
@@ -94,11 +251,279 @@ def disconnect(alias=DEFAULT_CONNECTION_NAME):
     Copied from mongoengine/connection.py to fix a bug in mongoengine source code,
     ('disconnect' method is removed from pymongo MongoClient in latest version.)
     """
-    global _connections
-    global _dbs
+    _connections = mongo_connection._connections
+    _dbs = mongo_connection._dbs
+
+    if alias in _connections and _connections[alias] is _pooled_connection['client']:
+        return close_pooled()
 
     if alias in _connections:
-        get_connection(alias=alias).close()
+        mongo_connection.get_connection(alias=alias).close()
         del _connections[alias]
     if alias in _dbs:
         del _dbs[alias]
+
+
+_pooled_connection = {
+    'key': None,
+    'client': None,
+}
+
+
+def _settings_key(db_settings):
+    """ (dict) -> (tuple)
+    return hashable representation of mongo settings, used to detect settings change.
+    """
+    return tuple(sorted((key, repr(value)) for key, value in db_settings.items()))
+
+
+def connect_pooled(db_settings):
+    """ (dict) -> (MongoClient)
+    return a MongoClient shared by every registered mongoengine alias for the whole process.
+
+    A new client (and connection pool) is created only if there is none yet or
+    'db_settings' differ from the ones the existing client was created with.
+    Otherwise the existing client is reused, so server discovery and sockets
+    survive across tests.
+    """
+    key = _settings_key(db_settings)
+
+    if _pooled_connection['key'] != key:
+        close_pooled()
+
+        for alias in list(mongo_connection._connections.keys()):
+            disconnect(alias)
+
+        _register_aliases(db_settings, [DEFAULT_CONNECTION_NAME])
+        _pooled_connection['client'] = mongo_connection.get_connection(DEFAULT_CONNECTION_NAME)
+        _pooled_connection['key'] = key
+
+    client = _pooled_connection['client']
+    aliases = set(mongo_connection._connection_settings.keys()) | set([DEFAULT_CONNECTION_NAME])
+    stale_aliases = [alias for alias in aliases if mongo_connection._connections.get(alias) is not client]
+
+    if stale_aliases:
+        _register_aliases(db_settings, stale_aliases)
+
+        for alias in stale_aliases:
+            mongo_connection._connections[alias] = client
+            mongo_connection._dbs.pop(alias, None)
+
+    return client
+
+
+def _register_aliases(db_settings, aliases):
+    options = dict(db_settings, event_listeners = [command_listener.pymongo_listener()])
+    db_name = options.pop('db')
+
+    for alias in aliases:
+        mongo_connection.register_connection(alias, db_name, **options)
+
+
+def close_pooled():
+    """ (NoneType) -> (NoneType)
+    close the process wide MongoClient, if any, and detach it from all mongoengine aliases.
+    """
+    client = _pooled_connection['client']
+
+    if client is None:
+        return
+
+    for alias in [alias for alias, connection in list(mongo_connection._connections.items()) if connection is client]:
+        del mongo_connection._connections[alias]
+        mongo_connection._dbs.pop(alias, None)
+
+    client.close()
+    _pooled_connection['client'] = _pooled_connection['key'] = None
+
+
+atexit.register(close_pooled)
+
+
+def get_worker_id():
+    """ (NoneType) -> (int or NoneType)
+    return index of django's parallel test runner worker running current process,
+    or None outside parallel worker.
+    """
+    try:
+        from django.test import runner
+    except ImportError:
+        return None
+
+    return getattr(runner, '_worker_id', 0) or None
+
+
+def worker_name(prefix = 'test'):
+    """ (str) -> (str or NoneType)
+    return name of resource isolated for current parallel worker, e.g. 'test_3', or None outside worker.
+    """
+    worker_id = get_worker_id()
+
+    return None if worker_id is None else '{0}_{1}'.format(prefix, worker_id)
+
+
+def worker_mongo_settings(db_settings):
+    """ (dict) -> (dict)
+    return mongo settings using database of current parallel worker, e.g. 'test_3'.
+
+    Worker database is created lazily by mongo and dropped when worker exits.
+    """
+    worker_id = get_worker_id()
+
+    if worker_id is None:
+        return db_settings
+
+    db_settings = dict(db_settings, db = '{0}_{1}'.format(db_settings['db'], worker_id))
+    _register_worker_database(db_settings['db'])
+
+    return db_settings
+
+
+_worker_databases = set()
+
+
+def _register_worker_database(db_name):
+    if db_name in _worker_databases:
+        return
+
+    _worker_databases.add(db_name)
+    at_exit(_drop_worker_database, db_name)
+
+
+def _drop_worker_database(db_name):
+    client = _pooled_connection['client'] or mongo_connection._connections.get(DEFAULT_CONNECTION_NAME)
+
+    if client is not None:
+        client.drop_database(db_name)
+
+
+def at_exit(func, *args):
+    """ (callable, *object) -> (NoneType)
+    call 'func' when current process exits, including django's parallel test runner workers,
+    which exit without running atexit handlers.
+    """
+    if get_worker_id() is None:
+        atexit.register(func, *args)
+    else:
+        multiprocessing.util.Finalize(None, func, args = args, exitpriority = 10)
+
+
+TRANSACTION_TOPOLOGIES = ('ReplicaSetWithPrimary', 'Sharded')
+
+
+def supports_transactions(client):
+    """ (MongoClient) -> (bool)
+    return True if mongo deployment of 'client' is a replica set (single node ones too) or sharded cluster.
+    """
+    client.admin.command('ping')
+
+    return client.topology_description.topology_type_name in TRANSACTION_TOPOLOGIES
+
+
+# pymongo Collection methods run in session bound by bind_session, DDL and commands
+# transactions do not support are left out, estimated_document_count is replaced by count_documents
+SESSION_COLLECTION_METHODS = (
+    'find', 'find_one', 'find_raw_batches', 'find_one_and_delete', 'find_one_and_replace', 'find_one_and_update',
+    'insert_one', 'insert_many', 'replace_one', 'update_one', 'update_many', 'delete_one', 'delete_many',
+    'bulk_write', 'aggregate', 'aggregate_raw_batches', 'count_documents', 'distinct',
+)
+
+_bound_session = threading.local()
+
+
+def bind_session(session):
+    """ (ClientSession or NoneType) -> (NoneType)
+    run operations on collections of session's client, issued from current thread without a session
+    of their own, in 'session', until called with None.
+
+    Released mongoengine passes no session to pymongo, so pymongo's Collection class is patched, for the whole
+    process, on first call. Patched methods behave as before in threads with no session bound.
+    """
+    _instrument_collection_methods()
+    _bound_session.session = session
+
+
+def bound_session():
+    """ (NoneType) -> (ClientSession or NoneType)
+    return session bound to current thread by bind_session.
+    """
+    return getattr(_bound_session, 'session', None)
+
+
+def _instrument_collection_methods():
+    from pymongo.collection import Collection
+
+    for name in SESSION_COLLECTION_METHODS:
+        method = getattr(Collection, name, None)
+
+        if method is not None and not getattr(method, '_test_addons_session', False):
+            setattr(Collection, name, _method_in_bound_session(method))
+
+    method = Collection.estimated_document_count
+
+    if not getattr(method, '_test_addons_session', False):
+        Collection.estimated_document_count = _estimated_count_in_bound_session(method)
+
+
+def _method_in_bound_session(method):
+    def method_in_bound_session(collection, *args, **kwargs):
+        session = bound_session()
+
+        if session is not None and kwargs.get('session') is None and collection.database.client is session.client:
+            kwargs['session'] = session
+
+        return method(collection, *args, **kwargs)
+
+    method_in_bound_session.__name__ = method.__name__
+    method_in_bound_session.__doc__ = method.__doc__
+    method_in_bound_session._test_addons_session = True
+
+    return method_in_bound_session
+
+
+def _estimated_count_in_bound_session(method):
+    # estimated_document_count reads collection metadata, which does not see the transaction's
+    # own writes (and is not allowed in one), so unfiltered counts (e.g. mongoengine's
+    # Document.objects.count()) are counted by count_documents in bound session instead
+    def estimated_count_in_bound_session(collection, comment = None, **kwargs):
+        session = bound_session()
+
+        if session is None or 'session' in kwargs or collection.database.client is not session.client:
+            return method(collection, comment, **kwargs)
+
+        return collection.count_documents({}, session = session, comment = comment, **kwargs)
+
+    estimated_count_in_bound_session.__name__ = method.__name__
+    estimated_count_in_bound_session.__doc__ = method.__doc__
+    estimated_count_in_bound_session._test_addons_session = True
+
+    return estimated_count_in_bound_session
+
+
+def ensure_collections():
+    """ (NoneType) -> (NoneType)
+    create collections and indexes of every registered mongoengine document.
+
+    DDL cannot be rolled back by aborting a transaction, so it is run up front, outside of it.
+    """
+    from mongoengine import Document
+    from mongoengine.base import _document_registry
+    from mongoengine.connection import ConnectionFailure
+
+    for document in list(_document_registry.values()):
+        if issubclass(document, Document) and not document._meta.get('abstract'):
+            try:
+                document._get_collection()
+            except ConnectionFailure:
+                # document uses an alias not configured for tests
+                continue
+
+
+def without_mongo_transaction(test_method):
+    """ (function) -> (function)
+    decorate test method (e.g. one running DDL) to be isolated by cleanup, instead of transaction rollback,
+    in test case using MONGO_ISOLATION = 'transaction'.
+    """
+    test_method.mongo_transaction = False
+
+    return test_method